@@ -0,0 +1,111 @@
+import asyncio
+import random
+
+from aiohttp import web
+
+"""
+-------------------------------------------------------------------------------
+    Local FACEIT API stub
+
+    Serves the handful of FACEIT endpoints the bot uses, from in-memory data,
+    with configurable latency. Both the data API and the internal api.faceit.com
+    routes live on the same server so FaceitClient can point both base URLs
+    at it.
+-------------------------------------------------------------------------------
+"""
+
+
+def fake_stream(n):
+    return {
+        "userNickname": "streamer{}".format(n),
+        "competitionName": "NACCS Collegiate Queue",
+        "factionNickname": "team_streamer{}".format(n),
+        "stream": {
+            "channelUrl": "https://twitch.tv/streamer{}".format(n),
+            "channelLogo": "https://example.com/logo{}.png".format(n),
+            "viewers": random.randint(0, 500),
+        },
+    }
+
+
+def fake_match(n, status='ONGOING'):
+    def roster(side):
+        return [{"nickname": "m{}_{}{}".format(n, side, i)} for i in range(5)]
+
+    return {
+        "match_id": "bench-match-{}".format(n),
+        "status": status,
+        "faceit_url": "https://www.faceit.com/{lang}/csgo/room/bench-match-" + str(n),
+        "teams": {
+            "faction1": {"name": "team_a{}".format(n), "roster": roster('a')},
+            "faction2": {"name": "team_b{}".format(n), "roster": roster('b')},
+        },
+        "voting": {"location": {"pick": ["Chicago"]}, "map": {"pick": ["de_inferno"]}},
+    }
+
+
+class FaceitStub:
+    def __init__(self, latency=0.08, jitter=0.03, streams=0, matches=0, queue=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.streams = [fake_stream(n) for n in range(streams)]
+        self.matches = [fake_match(n) for n in range(matches)]
+        self.queue_size = queue
+        self.queue_open = {}
+        self.hits = {}
+        self.url = None
+        self._runner = None
+
+    async def _delay(self, name):
+        self.hits[name] = self.hits.get(name, 0) + 1
+        await asyncio.sleep(max(0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    async def hub_matches(self, request):
+        await self._delay('hub_matches')
+        return web.json_response({"items": self.matches})
+
+    async def match(self, request):
+        await self._delay('match')
+        match_id = request.match_info['match_id']
+        for match in self.matches:
+            if match['match_id'] == match_id:
+                return web.json_response(match)
+        return web.json_response({"match_id": match_id, "status": "FINISHED"})
+
+    async def queue_players(self, request):
+        await self._delay('queue_players')
+        return web.json_response({"payload": [{"id": n} for n in range(self.queue_size)]})
+
+    async def queue(self, request):
+        await self._delay('queue')
+        queue_id = request.match_info['queue_id']
+        if request.method == 'PUT':
+            body = await request.json()
+            self.queue_open[queue_id] = bool(body.get('open'))
+        return web.json_response({"payload": {"id": queue_id, "open": self.queue_open.get(queue_id, False)}})
+
+    async def streamings(self, request):
+        await self._delay('streamings')
+        limit = int(request.query.get('limit', 40))
+        offset = int(request.query.get('offset', 0))
+        return web.json_response({"payload": self.streams[offset:offset + limit]})
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_get('/hubs/{hub_id}/matches', self.hub_matches)
+        app.router.add_get('/matches/{match_id}', self.match)
+        app.router.add_get('/queue/v1/player/{queue_id}', self.queue_players)
+        app.router.add_route('*', '/queue/v1/queue/{queue_id}', self.queue)
+        app.router.add_get('/stream/v1/streamings', self.streamings)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = "http://{}:{}/".format(host, port)
+        return self.url
+
+    async def stop(self):
+        if self._runner != None:
+            await self._runner.cleanup()
@@ -0,0 +1,358 @@
+import asyncio
+import datetime
+import itertools
+import random
+import time
+from collections import Counter
+
+"""
+-------------------------------------------------------------------------------
+    Fake Discord objects
+
+    Just enough of the discord.py Guild/Channel/Member/Message surface for the
+    bot's hot paths. Every call that would be a REST request goes through
+    FakeDiscordAPI, which adds simulated latency and enforces per-route
+    rate-limit buckets the way discord.py 1.2 does (one request at a time per
+    bucket, waiting out the bucket when it's empty).
+-------------------------------------------------------------------------------
+"""
+
+_ids = itertools.count(10 ** 17)
+
+
+def next_id():
+    return next(_ids)
+
+
+class Bucket:
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0
+        self.lock = asyncio.Lock()
+
+
+class FakeDiscordAPI:
+    def __init__(self, latency=0.05, jitter=0.02, limits=None, default_limit=(50, 1.0)):
+        # limits: route -> (requests, per seconds)
+        self.latency = latency
+        self.jitter = jitter
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.buckets = {}
+        self.calls = Counter()
+        self.rate_limited = Counter()
+
+    def _bucket(self, route, major):
+        bucket = self.buckets.get((route, major))
+        if bucket == None:
+            limit, per = self.limits.get(route, self.default_limit)
+            bucket = self.buckets[(route, major)] = Bucket(limit, per)
+        return bucket
+
+    #
+    #   major: the ID Discord scopes the route's bucket to (channel or guild)
+    #   latency: False for a limit that rides on another request, which
+    #   pays the round trip instead
+    #
+    async def call(self, route, major=None, latency=True):
+        bucket = self._bucket(route, major)
+        async with bucket.lock:
+            now = time.monotonic()
+            if now >= bucket.reset_at:
+                bucket.remaining = bucket.limit
+                bucket.reset_at = now + bucket.per
+            if bucket.remaining <= 0:
+                self.rate_limited[route] += 1
+                await asyncio.sleep(bucket.reset_at - now)
+                bucket.remaining = bucket.limit
+                bucket.reset_at = time.monotonic() + bucket.per
+
+            bucket.remaining -= 1
+            self.calls[route] += 1
+            if latency:
+                await asyncio.sleep(max(0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    #
+    #   Wait until every bucket that resets within max_period is full again,
+    #   so one round of a scenario doesn't start in the previous one's debt.
+    #   Longer buckets, like renames, are left alone on purpose.
+    #
+    async def settle(self, max_period=60):
+        now = time.monotonic()
+        waits = [bucket.reset_at - now for bucket in self.buckets.values() if bucket.per <= max_period]
+        await asyncio.sleep(max([0] + waits))
+
+
+class FakeRole:
+    def __init__(self, name):
+        self.id = next_id()
+        self.name = name
+
+    def is_default(self):
+        return self.name == "@everyone"
+
+
+class FakeMember:
+    def __init__(self, api, guild, name, discriminator, nick=None, roles=()):
+        self.api = api
+        self.guild = guild
+        self.id = next_id()
+        self.name = name
+        self.discriminator = discriminator
+        self.nick = nick
+        self.roles = list(roles)
+        self.bot = False
+        self.voice_channel = None
+
+    def __str__(self):
+        return "{}#{}".format(self.name, self.discriminator)
+
+    @property
+    def mention(self):
+        return "<@{}>".format(self.id)
+
+    async def move_to(self, channel):
+        await self.api.call('PATCH /guilds/{guild_id}/members/{user_id}', self.guild.id)
+        if self.voice_channel != None:
+            self.voice_channel.connected.remove(self)
+        self.voice_channel = channel
+        if channel != None:
+            channel.connected.append(self)
+
+    async def add_roles(self, *roles):
+        for role in roles:
+            await self.api.call('PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}', self.guild.id)
+            if role not in self.roles:
+                self.roles.append(role)
+
+    async def remove_roles(self, *roles):
+        for role in roles:
+            await self.api.call('DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}', self.guild.id)
+            if role in self.roles:
+                self.roles.remove(role)
+
+    async def edit(self, nick=None, **kwargs):
+        await self.api.call('PATCH /guilds/{guild_id}/members/{user_id}', self.guild.id)
+        self.nick = nick
+
+    async def send(self, content=None, **kwargs):
+        # DM channel, its own bucket per user
+        await self.api.call('POST /channels/{channel_id}/messages', self.id)
+
+
+class FakeCategory:
+    def __init__(self, guild, category_id, name):
+        self.guild = guild
+        self.id = category_id
+        self.name = name
+        self.channels = []
+        self.overwrites = {}
+
+    @property
+    def voice_channels(self):
+        return [c for c in self.channels if isinstance(c, FakeVoiceChannel)]
+
+
+class FakeVoiceChannel:
+    def __init__(self, api, guild, name, category=None, user_limit=0, channel_id=None):
+        self.api = api
+        self.guild = guild
+        self.id = channel_id or next_id()
+        self.name = name
+        self.category = category
+        self.category_id = category.id if category != None else None
+        self.user_limit = user_limit
+        self.connected = []
+        # Naive UTC, like the snowflake-derived created_at in discord.py
+        self.created_at = datetime.datetime.utcnow()
+
+    @property
+    def members(self):
+        # discord.py builds this from voice states, so it's a fresh list
+        return list(self.connected)
+
+    async def edit(self, name=None, user_limit=None, **kwargs):
+        if name != None and name != self.name:
+            # Renames have their own, much tighter, per-channel limit on top
+            # of the PATCH they're part of
+            await self.api.call('PATCH /channels/{channel_id} (rename)', self.id, latency=False)
+        await self.api.call('PATCH /channels/{channel_id}', self.id)
+        if name != None:
+            self.name = name
+        if user_limit != None:
+            self.user_limit = user_limit
+
+    async def set_permissions(self, target, **permissions):
+        await self.api.call('PUT /channels/{channel_id}/permissions/{overwrite_id}', self.id)
+
+    async def delete(self, **kwargs):
+        await self.api.call('DELETE /channels/{channel_id}', self.id)
+        self.guild._remove_channel(self)
+
+
+class FakeMessage:
+    def __init__(self, api, channel, author, content=None, embed=None):
+        self.api = api
+        self.channel = channel
+        self.guild = channel.guild
+        self.id = next_id()
+        self.author = author
+        self.content = content
+        self.embeds = [embed] if embed != None else []
+        self.webhook_id = None
+        self.pinned = False
+        self.created_at = datetime.datetime.utcnow()
+
+    async def edit(self, content=None, embed=None, **kwargs):
+        await self.api.call('PATCH /channels/{channel_id}/messages/{message_id}', self.channel.id)
+        if content != None:
+            self.content = content
+        if embed != None:
+            self.embeds = [embed]
+
+    async def delete(self, delay=None):
+        # Like discord.py, a delayed delete returns straight away
+        if delay:
+            async def delete_later():
+                await asyncio.sleep(delay)
+                await self.delete()
+            asyncio.ensure_future(delete_later())
+            return
+
+        await self.api.call('DELETE /channels/{channel_id}/messages/{message_id}', self.channel.id)
+        if self in self.channel.messages:
+            self.channel.messages.remove(self)
+
+    async def pin(self):
+        await self.api.call('PUT /channels/{channel_id}/pins/{message_id}', self.channel.id)
+        self.pinned = True
+
+
+class FakeTextChannel:
+    def __init__(self, api, guild, name, channel_id=None):
+        self.api = api
+        self.guild = guild
+        self.id = channel_id or next_id()
+        self.name = name
+        self.messages = []
+
+    async def send(self, content=None, embed=None, delete_after=None, **kwargs):
+        await self.api.call('POST /channels/{channel_id}/messages', self.id)
+        message = FakeMessage(self.api, self, self.guild.me, content=content, embed=embed)
+        self.messages.append(message)
+        if delete_after != None:
+            asyncio.ensure_future(message.delete(delay=delete_after))
+        return message
+
+    async def fetch_message(self, message_id):
+        await self.api.call('GET /channels/{channel_id}/messages/{message_id}', self.id)
+        for message in self.messages:
+            if message.id == message_id:
+                return message
+        raise LookupError(message_id)
+
+    async def delete_messages(self, messages):
+        await self.api.call('POST /channels/{channel_id}/messages/bulk-delete', self.id)
+        for message in messages:
+            if message in self.messages:
+                self.messages.remove(message)
+
+    async def pins(self):
+        await self.api.call('GET /channels/{channel_id}/pins', self.id)
+        return [m for m in self.messages if m.pinned]
+
+    def history(self, limit=None):
+        return _AsyncIter(list(reversed(self.messages))[:limit])
+
+
+class _AsyncIter:
+    def __init__(self, items):
+        self._items = iter(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeGuild:
+    def __init__(self, api, name="Bench Guild"):
+        self.api = api
+        self.id = next_id()
+        self.name = name
+        self.members = []
+        self.default_role = FakeRole("@everyone")
+        self.roles = [self.default_role, FakeRole("Member"), FakeRole("Ping"), FakeRole("Tech Crew")]
+        self.categories = []
+        self._channels = {}
+        self.me = FakeMember(api, self, "NACCS Bot", "0000")
+        self.me.bot = True
+
+    def add_member(self, name, discriminator, nick=None):
+        member = FakeMember(self.api, self, name, discriminator, nick=nick)
+        self.members.append(member)
+        return member
+
+    def add_category(self, category_id, name):
+        category = FakeCategory(self, category_id, name)
+        self.categories.append(category)
+        self._channels[category.id] = category
+        return category
+
+    def add_voice_channel(self, name, category=None, channel_id=None):
+        channel = FakeVoiceChannel(self.api, self, name, category=category, channel_id=channel_id)
+        self._register(channel)
+        return channel
+
+    def add_text_channel(self, name, channel_id=None):
+        channel = FakeTextChannel(self.api, self, name, channel_id=channel_id)
+        self._register(channel)
+        return channel
+
+    def _register(self, channel):
+        self._channels[channel.id] = channel
+        category = getattr(channel, 'category', None)
+        if category != None:
+            category.channels.append(channel)
+
+    def _remove_channel(self, channel):
+        self._channels.pop(channel.id, None)
+        category = getattr(channel, 'category', None)
+        if category != None and channel in category.channels:
+            category.channels.remove(channel)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def get_member(self, member_id):
+        for member in self.members:
+            if member.id == member_id:
+                return member
+        return None
+
+    def get_member_named(self, name):
+        for member in self.members:
+            if str(member) == name or member.nick == name or member.name == name:
+                return member
+        return None
+
+    async def create_voice_channel(self, name, category=None, user_limit=0, **kwargs):
+        await self.api.call('POST /guilds/{guild_id}/channels', self.id)
+        channel = FakeVoiceChannel(self.api, self, name, category=category, user_limit=user_limit)
+        self._register(channel)
+        return channel
+
+
+class FakeContext:
+    def __init__(self, channel, author):
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.message = FakeMessage(channel.api, channel, author, content="")
+        self.command_failed = False
@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+
+"""
+-------------------------------------------------------------------------------
+    Offline benchmarks for the bot's hot paths
+
+    Runs the real handlers from naccs_bot against a local FACEIT stub, an
+    in-memory SQLite copy of the website tables and a fake Discord guild with
+    simulated latency and rate limits.
+
+        python -m bench.run                        # every scenario
+        python -m bench.run ready-burst --matches 30 --window 10
+        python -m bench.run streams --streams 120
+        python -m bench.run matches-command --users 20
+-------------------------------------------------------------------------------
+"""
+
+# Keep the bot's own state out of the working directory
+os.environ.setdefault('STATE_DB', ':memory:')
+
+import naccs_bot
+import db
+import events
+import faceit_api
+import hubs
+import streams
+from tracing import percentile
+
+from bench.fakes import FakeDiscordAPI, FakeGuild, FakeMessage, FakeContext
+from bench.faceit_stub import FaceitStub, fake_stream
+from bench.sqlite_db import BenchDatabase
+
+# Rough per-route limits (requests, per seconds). Discord doesn't publish
+# these; they're in line with the X-RateLimit headers it sends back.
+DISCORD_LIMITS = {
+    'POST /guilds/{guild_id}/channels': (5, 5.0),
+    'DELETE /channels/{channel_id}': (5, 5.0),
+    'PATCH /channels/{channel_id}': (5, 5.0),
+    'PATCH /channels/{channel_id} (rename)': (2, 600.0),
+    'PUT /channels/{channel_id}/permissions/{overwrite_id}': (5, 5.0),
+    'PATCH /guilds/{guild_id}/members/{user_id}': (10, 10.0),
+    'POST /channels/{channel_id}/messages': (5, 5.0),
+    'PATCH /channels/{channel_id}/messages/{message_id}': (5, 5.0),
+    'DELETE /channels/{channel_id}/messages/{message_id}': (5, 1.0),
+}
+
+
+def report(name, latencies, elapsed, api, stub, before_calls, before_hits):
+    print()
+    print("== {} ==".format(name))
+    if latencies:
+        latencies = sorted(latencies)
+        print("  ops {:>6}   elapsed {:>7.2f}s   throughput {:>7.1f}/s".format(len(latencies), elapsed, len(latencies) / elapsed if elapsed else 0))
+        print("  latency   p50 {:>7.3f}s   p95 {:>7.3f}s   p99 {:>7.3f}s   max {:>7.3f}s".format(
+            percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99), max(latencies)))
+    else:
+        print("  elapsed {:>7.2f}s".format(elapsed))
+
+    calls = api.calls - before_calls
+    if calls:
+        print("  discord calls ({} total)".format(sum(calls.values())))
+        for route, count in calls.most_common():
+            limited = api.rate_limited.get(route, 0)
+            print("    {:>6}  {}{}".format(count, route, "  ({} rate limited)".format(limited) if limited else ""))
+
+    hits = {k: v - before_hits.get(k, 0) for k, v in stub.hits.items() if v - before_hits.get(k, 0)}
+    if hits:
+        print("  faceit requests: " + ", ".join("{} {}".format(k, v) for k, v in sorted(hits.items())))
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.api = FakeDiscordAPI(latency=args.discord_latency, limits={} if args.no_rate_limits else DISCORD_LIMITS)
+        self.stub = FaceitStub(latency=args.faceit_latency, streams=args.streams, matches=5, queue=7)
+        self.database = BenchDatabase(latency=args.db_latency)
+        self.guild = FakeGuild(self.api)
+
+    async def setup(self):
+        url = await self.stub.start()
+        naccs_bot.faceit_client = faceit_api.FaceitClient('bench', 'bench', data_url=url, api_url=url)
+        naccs_bot.db_pool = db.ConnectionPool(self.database.connector(), max_size=4)
+
+        guild = self.guild
+        general = guild.add_category(hubs.GENERAL_CATEGORY, "Collegiate Queue")
+        power = guild.add_category(hubs.POWER_PUG_CATEGORY, "Power Pugs")
+        self.lobby = guild.add_voice_channel("Lobby", category=general, channel_id=hubs.GENERAL_LOBBY)
+        guild.add_voice_channel("Power Lobby", category=power, channel_id=hubs.POWER_PUG_LOBBY)
+        guild.add_text_channel("streams", channel_id=hubs.LEAGUE_STREAMS)
+        guild.add_text_channel("collegiate", channel_id=hubs.GENERAL_CHANNEL)
+        guild.add_text_channel("power-pugs", channel_id=hubs.POWER_PUG_CHANNEL)
+
+        naccs_bot.client.get_channel = guild.get_channel
+        naccs_bot.client.get_guild = lambda guild_id: guild if guild_id == guild.id else None
+        self.webhook_channel = guild.add_text_channel("webhooks")
+
+        # Same start-up as on_ready: adopt pooled channels, then top them up
+        await naccs_bot.start_channel_pools()
+        await naccs_bot.maintain_channel_pools.coro()
+        naccs_bot.event_dispatcher.start()
+
+    async def teardown(self):
+        await naccs_bot.event_dispatcher.stop()
+        await naccs_bot.faceit_client.close()
+        await self.stub.stop()
+        naccs_bot.db_pool.close()
+        self.database.close()
+
+    def snapshot(self):
+        return self.api.calls.copy(), dict(self.stub.hits)
+
+    #
+    #   N matches go ready at random points within a window, then all finish.
+    #   The second round reuses the channels the first one returned to the
+    #   pool.
+    #
+    async def ready_burst(self):
+        count, window = self.args.matches, self.args.window
+        parsed_events = []
+        for n in range(count):
+            teams = []
+            for side in ('a', 'b'):
+                players = []
+                for i in range(5):
+                    faceit = "bench{}_{}{}".format(n, side, i)
+                    member = self.guild.add_member("player_" + faceit, "0001")
+                    member.voice_channel = self.lobby
+                    self.lobby.connected.append(member)
+                    self.database.add_user(faceit, str(member))
+                    players.append(faceit)
+                teams.append({'team_name': "team_{}{}".format(side, n), 'players': players})
+            parsed_events.append({'event': events.MATCH_READY, 'match_id': "bench-ready-{}".format(n),
+                                    'hub': 'NACCS Collegiate Queue', 'teams': teams})
+        naccs_bot.index_guild(self.guild)
+
+        async def send_later(parsed, delay):
+            await asyncio.sleep(delay)
+            message = FakeMessage(self.api, self.webhook_channel, None)
+            await naccs_bot.ingest_event(message, parsed)
+
+        # Both rounds go ready at the same offsets, so only the pool differs
+        delays = [random.uniform(0, window) for _ in parsed_events]
+        for label in ("cold pool", "warm pool"):
+            round_events = [dict(parsed, match_id="{}-{}".format(parsed['match_id'], label.split()[0])) for parsed in parsed_events]
+
+            await self.api.settle()
+            before = self.snapshot()
+            start = time.monotonic()
+            await asyncio.gather(*[send_later(parsed, delay) for parsed, delay in zip(round_events, delays)])
+            await naccs_bot.event_dispatcher.join()
+            elapsed = time.monotonic() - start
+
+            ids = set(parsed['match_id'] for parsed in round_events)
+            records = [r for r in naccs_bot.tracer.setups if r['match_id'] in ids]
+            report("ready-burst, {}: {} matches within {}s (webhook -> last player moved)".format(label, count, window),
+                    [r['setup'] for r in records], elapsed, self.api, self.stub, *before)
+            # Player moves share one guild-wide bucket and dominate the total,
+            # so show the part the pool changes on its own
+            channels = sorted(r['channels'] for r in records if r['channels'] != None)
+            if channels:
+                print("  channels  p50 {:>7.3f}s   p95 {:>7.3f}s   max {:>7.3f}s   (webhook -> team channels ready)".format(
+                    percentile(channels, 50), percentile(channels, 95), channels[-1]))
+
+            before = self.snapshot()
+            start = time.monotonic()
+            for parsed in round_events:
+                finished = {'event': events.MATCH_FINISHED, 'match_id': parsed['match_id'], 'hub': parsed['hub']}
+                await naccs_bot.ingest_event(FakeMessage(self.api, self.webhook_channel, None), finished)
+            await naccs_bot.event_dispatcher.join()
+            elapsed = time.monotonic() - start
+
+            teardowns = [r['teardown'] for r in naccs_bot.tracer.teardowns if r['match_id'] in ids]
+            report("finish-burst, {}: {} matches finish at once (webhook -> channels emptied)".format(label, count),
+                    teardowns, elapsed, self.api, self.stub, *before)
+
+    #
+    #   Cold refresh, a refresh with nothing changed, then one with churn
+    #
+    async def streams(self):
+        refresh = naccs_bot.get_streams.coro
+        naccs_bot.displayed_streams = streams.StreamReconciler()
+
+        for label, mutate in (("cold", None), ("unchanged", None), ("10% churn", self._churn_streams)):
+            if mutate != None:
+                mutate()
+            before = self.snapshot()
+            start = time.monotonic()
+            await refresh()
+            elapsed = time.monotonic() - start
+            report("streams ({} live, {})".format(len(self.stub.streams), label), [elapsed], elapsed, self.api, self.stub, *before)
+
+    def _churn_streams(self):
+        live = self.stub.streams
+        changed = max(1, len(live) // 10)
+        for stream in random.sample(live, min(changed, len(live))):
+            stream['stream']['viewers'] += random.randint(1, 50)
+        del live[:changed // 2]
+        start = len(live) + 10 ** 6
+        live.extend(fake_stream(start + n) for n in range(changed // 2))
+
+    #
+    #   U users run .matches at the same moment
+    #
+    async def matches_command(self):
+        channel = self.guild.get_channel(hubs.GENERAL_CHANNEL)
+        users = [self.guild.add_member("matches_user{}".format(n), "0001") for n in range(self.args.users)]
+
+        async def run(user):
+            context = FakeContext(channel, user)
+            start = time.monotonic()
+            await naccs_bot.matches.callback(context)
+            return time.monotonic() - start
+
+        naccs_bot.matches_cache.invalidate(channel.id)
+        naccs_bot.queue_size_cache.invalidate(channel.id)
+        before = self.snapshot()
+        start = time.monotonic()
+        latencies = await asyncio.gather(*[run(user) for user in users])
+        report(".matches: {} users at once".format(len(users)), list(latencies), time.monotonic() - start,
+                self.api, self.stub, *before)
+
+
+SCENARIOS = {
+    'ready-burst': Harness.ready_burst,
+    'streams': Harness.streams,
+    'matches-command': Harness.matches_command,
+}
+
+
+async def main(args):
+    harness = Harness(args)
+    await harness.setup()
+    try:
+        for name in args.scenarios or list(SCENARIOS):
+            await SCENARIOS[name](harness)
+    finally:
+        await harness.teardown()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the NACCS bot")
+    parser.add_argument('scenarios', nargs='*', help="scenarios to run: {} (default: all)".format(", ".join(SCENARIOS)))
+    parser.add_argument('--matches', type=int, default=30, help="matches going ready in ready-burst")
+    parser.add_argument('--window', type=float, default=10, help="seconds the ready-burst is spread over")
+    parser.add_argument('--streams', type=int, default=120, help="live streams served by the stub")
+    parser.add_argument('--users', type=int, default=20, help="concurrent .matches users")
+    parser.add_argument('--discord-latency', type=float, default=0.05, help="simulated Discord round-trip (s)")
+    parser.add_argument('--faceit-latency', type=float, default=0.08, help="simulated FACEIT round-trip (s)")
+    parser.add_argument('--db-latency', type=float, default=0.002, help="simulated MySQL query time (s)")
+    parser.add_argument('--no-rate-limits', action='store_true', help="only apply a generous default limit to every route")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario {!r}".format(name))
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    random.seed(args.seed)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main(args))
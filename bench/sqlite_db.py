@@ -0,0 +1,106 @@
+import sqlite3
+import time
+
+"""
+-------------------------------------------------------------------------------
+    In-memory SQLite stand-in for the website's MySQL tables
+
+    Provides a connector for db.ConnectionPool whose connections look enough
+    like PyMySQL DictCursor connections (%s placeholders, dict rows, ping)
+    for the bot's queries to run unchanged.
+-------------------------------------------------------------------------------
+"""
+
+SCHEMA = """
+create table if not exists users_profile (
+    id                  integer primary key,
+    verified_student    integer not null default 0,
+    faceit              text collate nocase,
+    discord             text,
+    college             text
+);
+create index if not exists users_profile_faceit on users_profile (faceit);
+create index if not exists users_profile_discord on users_profile (discord);
+
+create table if not exists league_school (
+    id              integer primary key,
+    name            text not null,
+    abbreviation    text not null
+);
+"""
+
+
+class _Cursor:
+    def __init__(self, cursor, latency):
+        self._cursor = cursor
+        self._latency = latency
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self._cursor.close()
+
+    def execute(self, sql, args=None):
+        if self._latency:
+            time.sleep(self._latency)
+        self._cursor.execute(sql.replace('%s', '?'), tuple(args or ()))
+
+    def _row(self, row):
+        if row == None:
+            return None
+        return {description[0]: value for description, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+
+class _Connection:
+    def __init__(self, uri, latency):
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+        self._latency = latency
+
+    def cursor(self, *args, **kwargs):
+        return _Cursor(self._conn.cursor(), self._latency)
+
+    def ping(self, reconnect=False):
+        self._conn.execute("select 1")
+
+    def close(self):
+        self._conn.close()
+
+
+class BenchDatabase:
+    def __init__(self, name="naccs_bench", latency=0.002):
+        # latency: simulated per-query round-trip in seconds
+        self.uri = "file:{}?mode=memory&cache=shared".format(name)
+        self.latency = latency
+        # Shared-cache memory databases vanish when the last connection
+        # closes, so hold one open for the life of the benchmark
+        self._keeper = sqlite3.connect(self.uri, uri=True, check_same_thread=False, isolation_level=None)
+        self._keeper.executescript(SCHEMA)
+
+    def connector(self):
+        def connect():
+            return _Connection(self.uri, self.latency)
+        return connect
+
+    def add_user(self, faceit, discord, college="Bench University", verified=True):
+        self._keeper.execute("insert into users_profile (verified_student, faceit, discord, college) values (?, ?, ?, ?)",
+                                (1 if verified else 0, faceit, discord, college))
+
+    def add_school(self, name, abbreviation):
+        self._keeper.execute("insert into league_school (name, abbreviation) values (?, ?)", (name, abbreviation))
+
+    def close(self):
+        self._keeper.close()
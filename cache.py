@@ -0,0 +1,129 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+"""
+-------------------------------------------------------------------------------
+    In-memory caches
+-------------------------------------------------------------------------------
+"""
+
+# Sentinel returned by TTLCache.get() when a key isn't cached. None can't be
+# used because None is a valid cached value (negative caching).
+MISSING = object()
+
+
+#
+#   Size bounded LRU cache with per-entry expiry.
+#
+#   Negative results (None) can be given a shorter TTL so that players who
+#   link their accounts don't have to wait out the full positive TTL.
+#
+class TTLCache:
+    def __init__(self, max_size=2048, ttl=600, negative_ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key) is not MISSING
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return MISSING
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+#
+#   Async cache for expensive lookups that many callers want at once.
+#
+#   - Concurrent misses for a key share one in-flight fetch (single-flight).
+#   - Within `ttl` the cached value is returned as is.
+#   - Between `ttl` and `stale_ttl` the cached value is returned immediately
+#     while a refresh runs in the background (stale-while-revalidate).
+#   - A fetch that returns None is treated as a failure and not cached.
+#
+class SingleFlightCache:
+    def __init__(self, fetch, ttl=15, stale_ttl=120):
+        # fetch: coroutine function(key) -> value
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = {}
+        self._inflight = {}
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry != None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                return value
+            if age < self.stale_ttl:
+                self._refresh(key)
+                return value
+
+        return await asyncio.shield(self._refresh(key))
+
+    def peek(self, key):
+        entry = self._entries.get(key)
+        return None if entry == None else entry[0]
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    #
+    #   Store a value fetched elsewhere as if it had just been loaded
+    #
+    def set(self, key, value):
+        if value != None:
+            self._entries[key] = (value, time.monotonic())
+
+    def _refresh(self, key):
+        task = self._inflight.get(key)
+        if task == None:
+            task = asyncio.ensure_future(self._load(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _load(self, key):
+        try:
+            value = await self.fetch(key)
+        except Exception as e:
+            print("Cache refresh failed for", key, repr(e))
+            value = None
+
+        if value != None:
+            self._entries[key] = (value, time.monotonic())
+            return value
+
+        # Failed refresh: fall back to whatever we had, however old
+        return self.peek(key)
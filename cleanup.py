@@ -0,0 +1,96 @@
+import asyncio
+import datetime
+
+from discord import HTTPException, NotFound
+
+"""
+-------------------------------------------------------------------------------
+    Batched message cleanup
+
+    Command messages and the bot's temporary replies are deleted on a delay.
+    Rather than one timer and one DELETE per message, deletions are queued per
+    channel and flushed every couple of seconds through bulk delete, so a
+    channel costs one request per flush however many messages are due.
+
+    Discord only bulk deletes messages younger than 14 days; anything older
+    is deleted one at a time.
+-------------------------------------------------------------------------------
+"""
+
+BULK_DELETE_LIMIT = 100
+# A little under Discord's 14 days, so a message doesn't age out mid-request
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=5)
+
+
+class DeletionScheduler:
+    def __init__(self, interval=2):
+        # interval: seconds between flushes
+        self.interval = interval
+        # channel ID -> (channel, [(due, message)])
+        self._pending = {}
+        self._task = None
+
+    def __len__(self):
+        return sum(len(messages) for _, messages in self._pending.values())
+
+    #
+    #   Delete `message` about `delay` seconds from now
+    #
+    def schedule(self, message, delay=2):
+        due = asyncio.get_event_loop().time() + delay
+        _, messages = self._pending.setdefault(message.channel.id, (message.channel, []))
+        messages.append((due, message))
+        if self._task == None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print("Message cleanup failed", repr(e))
+
+    #
+    #   Delete every message that's due, or all of them with force
+    #
+    async def flush(self, force=False):
+        now = asyncio.get_event_loop().time()
+        work = []
+        for channel_id, (channel, messages) in list(self._pending.items()):
+            due = [message for when, message in messages if force or when <= now]
+            if not due:
+                continue
+            remaining = [(when, message) for when, message in messages if not (force or when <= now)]
+            if remaining:
+                self._pending[channel_id] = (channel, remaining)
+            else:
+                del self._pending[channel_id]
+            work.append(self._delete(channel, due))
+
+        if work:
+            await asyncio.gather(*work)
+
+    async def _delete(self, channel, messages):
+        cutoff = datetime.datetime.utcnow() - BULK_DELETE_MAX_AGE
+        recent = [message for message in messages if message.created_at > cutoff]
+        old = [message for message in messages if message.created_at <= cutoff]
+
+        for start in range(0, len(recent), BULK_DELETE_LIMIT):
+            chunk = recent[start:start + BULK_DELETE_LIMIT]
+            try:
+                await channel.delete_messages(chunk)
+            except NotFound:
+                # Only raised for a single message that's already gone
+                pass
+            except HTTPException as e:
+                print("Bulk delete of", len(chunk), "messages in", channel.id, "failed, deleting one by one", e)
+                old.extend(chunk)
+
+        for message in old:
+            try:
+                await message.delete()
+            except NotFound:
+                pass
+            except HTTPException as e:
+                print("Could not delete message", message.id, e)
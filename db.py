@@ -0,0 +1,204 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql
+
+"""
+-------------------------------------------------------------------------------
+    Pooled MySQL access
+
+    PyMySQL is a blocking driver, so every query runs on a small dedicated
+    thread pool instead of the event loop. The executor has exactly as many
+    threads as the pool has connections, which means a worker thread can
+    always get a connection without waiting on another thread.
+-------------------------------------------------------------------------------
+"""
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_size=4, max_idle=300, ping_after=30):
+        # connect: zero-arg callable returning a new DB-API connection
+        # max_idle: seconds an unused connection is kept before being closed
+        # ping_after: seconds of idleness after which a connection is pinged
+        #             before being handed out again
+        self._connect = connect
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix='db')
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return self._idle.qsize()
+
+    #
+    #   Get a healthy connection, opening a new one if none are idle.
+    #   Only ever called from an executor thread.
+    #
+    def _acquire(self):
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.max_idle:
+                self._discard(conn)
+                continue
+
+            if idle_for > self.ping_after:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception as e:
+                    print("Dropping dead DB connection", e)
+                    self._discard(conn)
+                    continue
+
+            return conn
+
+        with self._lock:
+            self._size += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+            raise
+
+    def _release(self, conn, broken=False):
+        if broken or self._closed:
+            self._discard(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+
+    def _discard(self, conn):
+        with self._lock:
+            self._size -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _execute(self, fn):
+        conn = self._acquire()
+        try:
+            result = fn(conn)
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            # Connection level failure, don't put it back in the pool
+            self._release(conn, broken=True)
+            raise
+        except Exception:
+            self._release(conn)
+            raise
+        self._release(conn)
+        return result
+
+    #
+    #   Run fn(connection) on the DB thread pool and await the result
+    #
+    async def run(self, fn):
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self._execute, fn)
+
+    async def fetchone(self, sql, args=None):
+        def query(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(sql, args)
+                return cursor.fetchone()
+        return await self.run(query)
+
+    async def fetchall(self, sql, args=None):
+        def query(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(sql, args)
+                return cursor.fetchall()
+        return await self.run(query)
+
+    #
+    #   Yield rows in batches from an unbuffered query.
+    #
+    #   One connection is held for the whole stream, between executor calls,
+    #   so a long stream can briefly take the pool one over max_size.
+    #
+    async def stream(self, sql, args=None, batch_size=500):
+        loop = asyncio.get_event_loop()
+
+        def run(fn, *fn_args):
+            return loop.run_in_executor(self._executor, fn, *fn_args)
+
+        conn = await run(self._acquire)
+        cursor = None
+        broken = False
+        try:
+            cursor = await run(conn.cursor, pymysql.cursors.SSDictCursor)
+            await run(cursor.execute, sql, args)
+            while True:
+                rows = await run(cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+                yield rows
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if cursor != None:
+                try:
+                    # Unbuffered cursors have to drain what's left first
+                    await run(cursor.close)
+                except Exception:
+                    broken = True
+            self._release(conn, broken=broken)
+
+    #
+    #   Close connections that have sat unused for longer than max_idle
+    #
+    def prune(self):
+        keep = []
+        now = time.monotonic()
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if now - last_used > self.max_idle:
+                self._discard(conn)
+            else:
+                keep.append((conn, last_used))
+
+        # LifoQueue: put oldest back first so the freshest is handed out next
+        for entry in reversed(keep):
+            self._idle.put(entry)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+        self._executor.shutdown(wait=False)
+
+
+def mysql_connector(host, user, password, db):
+    def connect():
+        return pymysql.connect(host=host, user=user,
+                                password=password, db=db, charset='utf8mb4',
+                                cursorclass=pymysql.cursors.DictCursor, autocommit=True,
+                                connect_timeout=5)
+    return connect
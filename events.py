@@ -0,0 +1,152 @@
+import asyncio
+import json
+import zlib
+
+import sentry_sdk
+
+import cache
+import metrics
+
+"""
+-------------------------------------------------------------------------------
+    FACEIT webhook event ingestion
+
+    Webhook payloads are parsed and validated once, duplicates are dropped,
+    and the rest are handed to a pool of workers. Every event for a given
+    match goes to the same worker so ready/finished for one match can never
+    be reordered, while different matches are handled in parallel.
+-------------------------------------------------------------------------------
+"""
+
+MATCH_READY         = "match_status_ready"
+MATCH_FINISHED      = "match_status_finished"
+MATCH_CANCELLED     = "match_status_cancelled"
+
+MATCH_EVENTS = (MATCH_READY, MATCH_FINISHED, MATCH_CANCELLED)
+
+
+class EventError(ValueError):
+    pass
+
+
+#
+#   Parse and validate a FACEIT webhook body.
+#
+#   Raises EventError if it isn't a match event we can handle.
+#
+def parse_event(content):
+    try:
+        parsed = json.loads(content)
+    except ValueError as e:
+        raise EventError("Webhook body is not JSON: {}".format(e))
+
+    if not isinstance(parsed, dict):
+        raise EventError("Webhook body is not an object")
+
+    event = parsed.get('event')
+    if event not in MATCH_EVENTS:
+        raise EventError("Unhandled event {!r}".format(event))
+
+    if not parsed.get('match_id') or not parsed.get('hub'):
+        raise EventError("Event {} is missing match_id or hub".format(event))
+
+    if event == MATCH_READY:
+        teams = parsed.get('teams')
+        if not isinstance(teams, list) or not all(isinstance(team, dict) and isinstance(team.get('players'), list) for team in teams):
+            raise EventError("Event {} has malformed teams".format(event))
+
+    return parsed
+
+
+class EventDispatcher:
+    def __init__(self, handlers, workers=8, dedupe_window=600, queue_size=256):
+        # handlers: event name -> coroutine function(context, parsed)
+        self.handlers = handlers
+        self.workers = workers
+        self.queue_size = queue_size
+        self._seen = cache.TTLCache(max_size=8192, ttl=dedupe_window)
+        self._queues = []
+        self._tasks = []
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    #
+    #   Events waiting to be handled, across all workers
+    #
+    @property
+    def depth(self):
+        return sum(queue.qsize() for queue in self._queues)
+
+    #
+    #   Start handling events, including any submitted before now
+    #
+    def start(self):
+        if self.running:
+            return
+        self._create_queues()
+        self._tasks = [asyncio.ensure_future(self._work(queue)) for queue in self._queues]
+
+    def _create_queues(self):
+        if not self._queues:
+            self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+
+    #
+    #   Wait until every queued event has been handled
+    #
+    async def join(self):
+        await asyncio.gather(*[queue.join() for queue in self._queues])
+
+    #
+    #   Whether submit would drop this event as a duplicate
+    #
+    def seen(self, parsed):
+        return (parsed['match_id'], parsed['event']) in self._seen
+
+    #
+    #   Queue a parsed event. Returns False if it was a duplicate.
+    #
+    #   An event counts as seen from when it is queued, so a redelivery
+    #   while it is still being handled is dropped. If the handler fails the
+    #   event is forgotten again, so a later redelivery is retried.
+    #
+    #   Events submitted before start() wait in their queue until then, so
+    #   nothing is handled before startup has recovered its state.
+    #
+    #   context is passed through to the handler untouched.
+    #
+    async def submit(self, context, parsed):
+        key = (parsed['match_id'], parsed['event'])
+        if self.seen(parsed):
+            print("Dropping duplicate", parsed['event'], "for match", parsed['match_id'])
+            return False
+        self._seen.set(key, True)
+
+        self._create_queues()
+        shard = zlib.crc32(parsed['match_id'].encode('utf-8')) % len(self._queues)
+        await self._queues[shard].put((context, parsed))
+        return True
+
+    async def _work(self, queue):
+        while True:
+            context, parsed = await queue.get()
+            handler = self.handlers.get(parsed['event'])
+            try:
+                if handler != None:
+                    with metrics.timed('webhook', parsed['event'], histogram=metrics.HANDLER_LATENCY):
+                        await handler(context, parsed)
+            except Exception as e:
+                print("Failed to handle", parsed['event'], "for match", parsed['match_id'], repr(e))
+                sentry_sdk.capture_exception(e)
+                # Let FACEIT's redelivery of this event through
+                self._seen.invalidate((parsed['match_id'], parsed['event']))
+            finally:
+                queue.task_done()
@@ -0,0 +1,181 @@
+import asyncio
+import random
+
+import aiohttp
+
+import metrics
+import ratelimit
+
+"""
+-------------------------------------------------------------------------------
+    Async FACEIT API client
+
+    One keep-alive aiohttp session is shared by every caller so requests
+    reuse pooled connections. Each endpoint family has its own timeout and
+    rate limit bucket, and 5xx/429 responses are retried with jittered
+    exponential backoff.
+
+    Every endpoint takes a ratelimit priority. The defaults suit how the bot
+    uses each one; callers pass their own when the same endpoint serves a
+    more or less urgent path.
+-------------------------------------------------------------------------------
+"""
+
+# FACEIT Endpoints
+FACEIT_DATA_V4      = "https://open.faceit.com/data/v4/"
+FACEIT_API          = "https://api.faceit.com/"
+
+# Seconds before we give up on a single attempt
+DATA_TIMEOUT        = 10
+QUEUE_TIMEOUT       = 5
+STREAM_TIMEOUT      = 10
+
+
+FACEIT_RETRIES = metrics.registry.counter('naccs_faceit_retries_total', 'FACEIT requests retried', labels=('status',))
+
+
+class FaceitError(Exception):
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class FaceitClient:
+    def __init__(self, api_key, bot_key, data_url=FACEIT_DATA_V4, api_url=FACEIT_API,
+                    retries=3, backoff=0.5, max_connections=20, limits=None):
+        self.api_key = api_key
+        self.bot_key = bot_key
+        self.data_url = data_url
+        self.api_url = api_url
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.limiter = ratelimit.RateLimiter(limits)
+        self._session = None
+
+    #
+    #   The session is created lazily so it binds to the running event loop
+    #
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def _data_headers(self):
+        return {'Authorization': 'Bearer ' + str(self.api_key)}
+
+    def _bot_headers(self):
+        return {'Authorization': 'Bearer ' + str(self.bot_key)}
+
+    def _retry_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff)
+        # Full jitter so concurrent callers don't retry in lockstep
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    #
+    #   family: ratelimit bucket, one of 'data', 'queue' or 'stream'
+    #
+    async def request(self, operation, method, url, timeout, family, priority,
+                        headers=None, params=None, json=None):
+        with metrics.timed('faceit', operation):
+            return await self._request(method, url, timeout, self.limiter.bucket(family), priority,
+                                        headers, params, json)
+
+    async def _request(self, method, url, timeout, bucket, priority, headers, params, json):
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        last_error = None
+
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            await bucket.acquire(priority)
+            try:
+                async with self.session().request(method, url, headers=headers, params=params,
+                                                    json=json, timeout=client_timeout) as response:
+                    bucket.update(response.headers)
+                    if response.status == 200:
+                        try:
+                            return await response.json(content_type=None)
+                        except ValueError as e:
+                            # Usually an error page from a proxy in front of
+                            # FACEIT; retried like a 5xx
+                            last_error = FaceitError("{} {} returned a body that isn't JSON: {!r}".format(method, url, e),
+                                                        status=response.status)
+                    else:
+                        body = await response.text()
+                        last_error = FaceitError("{} {} returned {}".format(method, url, response.status),
+                                                    status=response.status, body=body)
+                        if response.status != 429 and response.status < 500:
+                            raise last_error
+                        if response.status == 429:
+                            try:
+                                retry_after = float(response.headers.get('Retry-After'))
+                            except (TypeError, ValueError):
+                                retry_after = None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = FaceitError("{} {} failed: {!r}".format(method, url, e))
+
+            if attempt < self.retries:
+                FACEIT_RETRIES.inc(status=last_error.status or 'network')
+                if last_error.status == 429:
+                    # Hold back every caller of this family, not just us
+                    bucket.pause(self._retry_delay(attempt, retry_after), '429')
+                else:
+                    await asyncio.sleep(self._retry_delay(attempt, retry_after))
+
+        raise last_error
+
+    #
+    #   Matches in a hub. match_type is one of 'all', 'upcoming', 'ongoing', 'past'
+    #
+    async def hub_matches(self, hub_id, match_type='ongoing', offset=0, limit=20, priority=ratelimit.COMMAND):
+        url = self.data_url + "hubs/" + hub_id + "/matches"
+        params = {"type": match_type, "offset": offset, "limit": limit}
+        return await self.request('hub_matches', 'GET', url, DATA_TIMEOUT, 'data', priority,
+                                    headers=self._data_headers(), params=params)
+
+    #
+    #   Details of a single match, including its status
+    #
+    async def match(self, match_id, priority=ratelimit.MATCH):
+        url = self.data_url + "matches/" + match_id
+        return await self.request('match', 'GET', url, DATA_TIMEOUT, 'data', priority, headers=self._data_headers())
+
+    #
+    #   Players currently sitting in a queue
+    #
+    async def queue_players(self, queue_id, limit=15, priority=ratelimit.COMMAND):
+        url = self.api_url + "queue/v1/player/" + queue_id
+        response = await self.request('queue_players', 'GET', url, QUEUE_TIMEOUT, 'queue', priority,
+                                        headers=self._bot_headers(), params={"limit": limit})
+        return response['payload']
+
+    #
+    #   Queue settings, including whether it is open
+    #
+    async def queue(self, queue_id, priority=ratelimit.WINDOW):
+        url = self.api_url + "queue/v1/queue/" + queue_id
+        response = await self.request('queue', 'GET', url, QUEUE_TIMEOUT, 'queue', priority, headers=self._bot_headers())
+        return response['payload']
+
+    #
+    #   Open or close a queue
+    #
+    async def set_queue_open(self, queue_id, should_open, priority=ratelimit.WINDOW):
+        url = self.api_url + "queue/v1/queue/" + queue_id
+        return await self.request('set_queue_open', 'PUT', url, QUEUE_TIMEOUT, 'queue', priority,
+                                    headers=self._bot_headers(), json={"open": should_open})
+
+    #
+    #   Live streams of players currently in a match run by an organizer
+    #
+    async def streamings(self, organizer_id, limit=40, offset=0, priority=ratelimit.BACKGROUND):
+        url = self.api_url + "stream/v1/streamings"
+        params = {"limit": limit, "offset": offset, "organizerId": organizer_id}
+        return await self.request('streamings', 'GET', url, STREAM_TIMEOUT, 'stream', priority, params=params)
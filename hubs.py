@@ -0,0 +1,71 @@
+import os
+
+import routing
+
+"""
+-------------------------------------------------------------------------------
+    NACCS hubs and channels
+
+    FACEIT and Discord IDs the bot serves by default. Kept apart from
+    naccs_bot so the poller process can load the same hub routes without
+    pulling in the Discord bot.
+-------------------------------------------------------------------------------
+"""
+
+# FACEIT Organizer IDs
+NACCS_MAIN          = "80831a09-3b2d-4070-8a1a-3be4d3de2bb5"
+
+# Organizers whose live streams are shown in LEAGUE_STREAMS
+STREAM_ORGANIZERS   = [NACCS_MAIN]
+
+# FACEIT Hub IDs
+POWER_PUG_HUB       = "30d483b9-c337-4738-8d4a-b65bf656269d"
+GENERAL_HUB         = "a67c2ead-9968-4e8b-957b-fb8bc244b302"
+
+# FACEIT Queue IDs
+POWER_QUEUE_ID      = '5e33533649222000078eb060'
+GENERAL_QUEUE_ID    = '5d42347e5dca6f00071eaa09'
+
+# Discord Channel IDs
+POWER_PUG_CHANNEL   = 610367175487913984
+GENERAL_CHANNEL     = 615733303424843798
+POWER_PUG_CATEGORY  = 583601230073298954
+GENERAL_CATEGORY    = 546131185797955600
+POWER_PUG_LOBBY     = 583601364010270763
+GENERAL_LOBBY       = 542495905484505108
+LEAGUE_STREAMS      = 653368287010357248
+
+# Hubs served when HUBS_CONFIG isn't set. GUILD_ID is optional; without it
+# the guild is worked out from the category.
+DEFAULT_HUBS = {
+    "hubs": [
+        {
+            "name": "NACCS Collegiate Queue",
+            "hub_id": GENERAL_HUB,
+            "queue_id": GENERAL_QUEUE_ID,
+            "guild_id": os.environ.get('GUILD_ID'),
+            "category_id": GENERAL_CATEGORY,
+            "lobby_id": GENERAL_LOBBY,
+            "channel_id": GENERAL_CHANNEL,
+        },
+        {
+            "name": "NACCS Power Pugs",
+            "hub_id": POWER_PUG_HUB,
+            "queue_id": POWER_QUEUE_ID,
+            "guild_id": os.environ.get('GUILD_ID'),
+            "category_id": POWER_PUG_CATEGORY,
+            "lobby_id": POWER_PUG_LOBBY,
+            "channel_id": POWER_PUG_CHANNEL,
+            # Power Pugs matches don't get voice channels for now
+            "voice_channels": False,
+        },
+    ]
+}
+
+
+#
+#   Hub name/ID/channel -> routing.Hub, from HUBS_CONFIG if it's set
+#
+def load_routes():
+    path = os.environ.get('HUBS_CONFIG')
+    return routing.RoutingTable.from_file(path) if path else routing.RoutingTable.from_config(DEFAULT_HUBS)
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import stat
+
+"""
+-------------------------------------------------------------------------------
+    Gateway <-> poller IPC
+
+    Newline-delimited JSON over a local Unix socket. The gateway process
+    listens and the poller process connects, reconnecting with backoff if
+    either side restarts. Messages only flow from poller to gateway.
+
+    Nothing is queued while disconnected. Instead the poller sends a full
+    snapshot of its state every time it connects, so whatever was missed in
+    between is made up for in one go.
+-------------------------------------------------------------------------------
+"""
+
+# Socket path when POLLER_SOCKET isn't set
+DEFAULT_SOCKET = 'naccs_poller.sock'
+
+# Longest message accepted; a full stream snapshot is well under this
+MAX_MESSAGE = 4 * 1024 * 1024
+
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+#
+#   Remove a socket file left behind by a process that didn't shut down
+#   cleanly. Anything that isn't a socket is left alone.
+#
+def remove_stale_socket(path):
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class Listener:
+    def __init__(self, path, handle):
+        # handle: coroutine function(message), called in order of arrival
+        self.path = path
+        self.handle = handle
+        self._server = None
+        self._writers = set()
+
+    @property
+    def connections(self):
+        return len(self._writers)
+
+    async def start(self):
+        if self._server != None:
+            return
+        remove_stale_socket(self.path)
+        self._server = await asyncio.start_unix_server(self._connected, path=self.path, limit=MAX_MESSAGE)
+        print("Listening for the poller on", self.path)
+
+    async def stop(self):
+        if self._server != None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        # Closing the server leaves connections open; the poller should see
+        # this as the gateway going away
+        for writer in list(self._writers):
+            writer.close()
+
+    async def _connected(self, reader, writer):
+        self._writers.add(writer)
+        print("Poller connected")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line.decode('utf-8'))
+                except ValueError as e:
+                    print("Dropping malformed message from poller", e)
+                    continue
+
+                try:
+                    await self.handle(message)
+                except Exception as e:
+                    print("Could not apply", message.get('type'), "from poller", repr(e))
+        except (ConnectionError, ValueError) as e:
+            # ValueError: a message over MAX_MESSAGE. The poller resends
+            # everything when it reconnects.
+            print("Dropping poller connection", repr(e))
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+            print("Poller disconnected")
+
+
+class Publisher:
+    def __init__(self, path, snapshot, retry_delay=1, max_retry_delay=30):
+        # snapshot: function() -> [message], everything the gateway needs
+        # after connecting
+        self.path = path
+        self.snapshot = snapshot
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._writer = None
+
+    @property
+    def connected(self):
+        return self._writer != None
+
+    async def run(self):
+        delay = self.retry_delay
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                print("Could not reach gateway at", self.path, "retrying in", delay, "seconds", e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+
+            delay = self.retry_delay
+            print("Connected to gateway at", self.path)
+            # Written without yielding, so no diff can get in ahead of it
+            self._writer = writer
+            try:
+                for message in self.snapshot():
+                    writer.write(encode(message))
+                await writer.drain()
+                # The gateway never writes back; this returns when it goes away
+                await reader.read()
+            except ConnectionError:
+                pass
+            finally:
+                self._writer = None
+                writer.close()
+            print("Lost connection to gateway")
+
+    #
+    #   Send a message if connected. Returns False if it was dropped, in which
+    #   case the next snapshot covers it.
+    #
+    async def send(self, message):
+        writer = self._writer
+        if writer == None:
+            return False
+        try:
+            writer.write(encode(message))
+            await writer.drain()
+        except ConnectionError:
+            return False
+        return True
@@ -0,0 +1,87 @@
+"""
+-------------------------------------------------------------------------------
+    Guild member index
+
+    guild.get_member_named() walks every member of the guild on each call.
+    MemberIndex keeps the same lookups (name#discriminator first, then
+    nickname or username) in dicts, and is kept current from member events.
+-------------------------------------------------------------------------------
+"""
+
+
+def member_tag(member):
+    return "{}#{}".format(member.name, member.discriminator)
+
+
+class MemberIndex:
+    def __init__(self, members=()):
+        self._members = {}
+        self._keys = {}
+        self._by_tag = {}
+        self._by_name = {}
+        self._by_nick = {}
+        self.rebuild(members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def rebuild(self, members):
+        self._members.clear()
+        self._keys.clear()
+        self._by_tag.clear()
+        self._by_name.clear()
+        self._by_nick.clear()
+        for member in members:
+            self.add(member)
+
+    def add(self, member):
+        if member.id in self._members:
+            self.remove(member)
+
+        tag, name, nick = member_tag(member), member.name, member.nick
+        self._members[member.id] = member
+        self._keys[member.id] = (tag, name, nick)
+        self._by_tag[tag] = member.id
+        self._by_name.setdefault(name, set()).add(member.id)
+        if nick:
+            self._by_nick.setdefault(nick, set()).add(member.id)
+
+    def remove(self, member):
+        keys = self._keys.pop(member.id, None)
+        self._members.pop(member.id, None)
+        if keys == None:
+            return
+
+        tag, name, nick = keys
+        if self._by_tag.get(tag) == member.id:
+            del self._by_tag[tag]
+        self._discard(self._by_name, name, member.id)
+        if nick:
+            self._discard(self._by_nick, nick, member.id)
+
+    def update(self, member):
+        self.add(member)
+
+    def _discard(self, index, key, member_id):
+        ids = index.get(key)
+        if ids == None:
+            return
+        ids.discard(member_id)
+        if not ids:
+            del index[key]
+
+    #
+    #   Same rules as guild.get_member_named(): try name#discriminator, then
+    #   fall back to matching a nickname or username.
+    #
+    def get(self, name):
+        if len(name) > 5 and name[-5] == '#':
+            member_id = self._by_tag.get(name)
+            if member_id != None:
+                return self._members[member_id]
+
+        for index in (self._by_nick, self._by_name):
+            ids = index.get(name)
+            if ids:
+                return self._members[next(iter(ids))]
+        return None
@@ -0,0 +1,212 @@
+import asyncio
+import bisect
+import functools
+import time
+
+from aiohttp import web
+
+"""
+-------------------------------------------------------------------------------
+    Metrics
+
+    Counters, gauges and latency histograms kept in process and served in
+    the Prometheus text format on a local HTTP endpoint.
+
+    Use `with metrics.timed(service, operation):` around any outbound call.
+    It works the same around an await, and records an `outcome` label of
+    ok or error.
+-------------------------------------------------------------------------------
+"""
+
+# Seconds. Covers cache hits through to retried, rate limited requests.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = ['{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return ['{}{} {}'.format(self.name, _format_labels(self.labels, key), value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), fn=None):
+        # fn: optional zero-arg callable read at scrape time (unlabelled only)
+        super().__init__(name, help, labels)
+        self._values = {}
+        self._fn = fn
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self._fn != None:
+            try:
+                return ['{} {}'.format(self.name, self._fn())]
+            except Exception:
+                return []
+        return ['{}{} {}'.format(self.name, _format_labels(self.labels, key), value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series == None:
+            series = self._values[key] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            # Anything past the last bucket only shows up in +Inf (the count)
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def _samples(self):
+        lines = []
+        for key, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(self.name, _format_labels(self.labels, key, ('le', bound)), cumulative))
+            lines.append('{}_bucket{} {}'.format(self.name, _format_labels(self.labels, key, ('le', '+Inf')), series[-1]))
+            lines.append('{}_sum{} {}'.format(self.name, _format_labels(self.labels, key), series[-2]))
+            lines.append('{}_count{} {}'.format(self.name, _format_labels(self.labels, key), series[-1]))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), fn=None):
+        return self.register(Gauge(name, help, labels, fn))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+OUTBOUND_LATENCY = registry.histogram('naccs_outbound_seconds',
+                                        'Latency of calls to FACEIT, MySQL and Discord',
+                                        labels=('service', 'operation', 'outcome'))
+HANDLER_LATENCY = registry.histogram('naccs_handler_seconds',
+                                        'Latency of command and webhook handlers',
+                                        labels=('kind', 'name', 'outcome'))
+LOOP_LAG = registry.gauge('naccs_event_loop_lag_seconds', 'How late the event loop woke a sleeping task')
+
+
+class timed:
+    def __init__(self, service, operation, histogram=OUTBOUND_LATENCY):
+        self.histogram = histogram
+        self.labels = {self.histogram.labels[0]: service, self.histogram.labels[1]: operation}
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        outcome = 'ok' if exc_type == None else 'error'
+        self.histogram.observe(time.monotonic() - self.start, outcome=outcome, **self.labels)
+        return False
+
+
+#
+#   Time every Discord REST call, labelled by route template.
+#
+#   Wrapping discord.py's HTTPClient.request catches channel create/delete,
+#   member moves and message send/edit/delete alike, and the latency
+#   includes time spent waiting on discord.py's rate-limit buckets.
+#
+def instrument_discord(http):
+    request = http.request
+
+    @functools.wraps(request)
+    async def timed_request(route, **kwargs):
+        with timed('discord', route.method + ' ' + route.path):
+            return await request(route, **kwargs)
+
+    http.request = timed_request
+
+
+async def measure_loop_lag(interval=0.5):
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        LOOP_LAG.set(max(0.0, time.monotonic() - start - interval))
+
+
+#
+#   Serve /metrics. Returns the aiohttp runner so the caller can clean it up.
+#
+async def serve(host='127.0.0.1', port=9100):
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type='text/plain')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print("Serving metrics on", host, port)
+    return runner
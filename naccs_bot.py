@@ -1,81 +1,142 @@
-from discord.ext.commands import Bot, CommandNotFound
+from discord.ext.commands import AutoShardedBot, CommandNotFound
 from discord.utils import get
 from discord.ext.tasks import loop
-from discord import ChannelType, Embed
+from discord import ChannelType, Embed, HTTPException, NotFound
 import os
-import pymysql
-import json
 import threading
-import requests
 import asyncio
+import time
+import datetime
+import pytz
 import sentry_sdk
-import schedule
+import db
+import cache
+import cleanup
+import faceit_api
+import hubs
+import ipc
+import streams
+import state
+import events
+import members
+import poller
+import pool
+import ratelimit
+import schools
+import status
+import metrics
+import tracing
+import webhook
+import window
 
 sentry_sdk.init(dsn=os.environ.get('SENTRY_DSN', ''))
 
 BOT_PREFIX = (".")
 
-# FACEIT Endpoints
-FACEIT_DATA_V4      = "https://open.faceit.com/data/v4/"
-FACEIT_QUEUE_API   = "https://api.faceit.com/queue/v1/player/"
-FACEIT_STREAMINGS_V1_ORGANIZER = "https://api.faceit.com/stream/v1/streamings?limit=40&offset=0&organizerId="
-
-# FACEIT Organizer IDs
-NACCS_MAIN          = "80831a09-3b2d-4070-8a1a-3be4d3de2bb5"
-
-# FACEIT Hub IDs
-POWER_PUG_HUB       = "30d483b9-c337-4738-8d4a-b65bf656269d"
-GENERAL_HUB         = "a67c2ead-9968-4e8b-957b-fb8bc244b302"
-
 # FACEIT Division IDs
 VARSITY = '78aa12dc-6234-4abc-ab54-02eb3408039f'
 JUNIOR_VARSITY = 'cb04e1b2-a0c8-4212-9eb6-54243afbfa5b'
 
-# FACEIT Queue IDs
-POWER_QUEUE_ID      = '5e33533649222000078eb060'
-GENERAL_QUEUE_ID    = '5d42347e5dca6f00071eaa09'
-
-# Discord Channel IDs
-POWER_PUG_CHANNEL   = 610367175487913984
-GENERAL_CHANNEL     = 615733303424843798
-POWER_PUG_CATEGORY  = 583601230073298954
-GENERAL_CATEGORY    = 546131185797955600
-POWER_PUG_LOBBY     = 583601364010270763
-GENERAL_LOBBY       = 542495905484505108
-LEAGUE_STREAMS      = 653368287010357248
-
 # Secrets
 DISCORD_TOKEN       = os.environ.get('DISCORD_TOKEN')
 FACEIT_KEY          = os.environ.get('FACEIT_KEY')
 FACEIT_BOT_KEY      = os.environ.get('FACEIT_BOT_KEY')
-headers             = {"Authorization": "Bearer " + str(FACEIT_KEY)}
+
+# single: everything in this process (default)
+# gateway: Discord and match handling; stream and hub polling come from
+# poller.py running as its own process
+NACCS_MODES = ('single', 'gateway')
+NACCS_MODE = os.environ.get('NACCS_MODE', 'single')
+if NACCS_MODE not in NACCS_MODES:
+    raise SystemExit("NACCS_MODE must be one of {}, got {!r}. The poller runs from poller.py.".format(
+        ", ".join(NACCS_MODES), NACCS_MODE))
+
+# Unix socket the poller pushes updates to the gateway over
+POLLER_SOCKET = os.environ.get('POLLER_SOCKET', ipc.DEFAULT_SOCKET)
 
 # Discord Bot
-client = Bot(command_prefix=BOT_PREFIX)
+# Sharded so one process can serve several guilds; the shard count comes from
+# Discord unless SHARD_COUNT is set
+client = AutoShardedBot(command_prefix=BOT_PREFIX,
+                        shard_count=int(os.environ['SHARD_COUNT']) if os.environ.get('SHARD_COUNT') else None)
+
+# Shared FACEIT API client
+faceit_client = faceit_api.FaceitClient(FACEIT_KEY, FACEIT_BOT_KEY)
+
+# Hub name/ID/channel -> routing.Hub
+routes = hubs.load_routes()
+
+# Hub name -> guild ID, for hubs configured without one
+hub_guild_ids = {}
+
+# Deletes command messages and temporary replies in per-channel batches
+message_cleanup = cleanup.DeletionScheduler(interval=2)
 
 # Mapping of FACEIT Match ID -> List(Discord Voice Channels)
 channels = {}
 
-# Global var for get_streams()
-displayed_streams = {}
+# Per-match setup/teardown timings for .matchstats
+tracer = tracing.MatchTracer(capacity=500, spill_path=os.environ.get('MATCH_TRACE_FILE'))
+
+# Persistent copy of `channels` so matches survive a restart
+match_store = state.StateStore(os.environ.get('STATE_DB', 'naccs_bot.db'))
+
+# FACEIT match statuses after which a match's channels can be torn down
+MATCH_OVER_STATES = ('FINISHED', 'CANCELLED', 'ABORTED')
+
+# Guild ID -> MemberIndex, built at on_ready and kept current by member events
+member_indexes = {}
+
+# Max member moves in flight at once per guild, across every match, teardown
+# and reap. They all share Discord's per-guild member route bucket, so going
+# wider just queues inside discord.py.
+MOVE_CONCURRENCY = 5
+
+# Guild ID -> Semaphore holding moves to MOVE_CONCURRENCY
+move_limits = {}
+
+# Stream messages currently shown in LEAGUE_STREAMS, keyed by nickname
+displayed_streams = streams.StreamReconciler()
+
+# Unchanged streams cost nothing to refresh, so this can be fairly short
+STREAM_REFRESH_MINUTES = 2
 
 DB_HOST     = os.environ.get('DB_HOST')
 DB_PASSWORD = os.environ.get('DB_PASSWORD')
 DB_DB       = os.environ.get('DB_DB')
 DB_USER     = os.environ.get('DB_USER')
 
-# Purge the stream channel if the bot is just booting up
+# Load stream channel state if the bot is just booting up
 should_preload = True
 
-# Power Pug open status
-window_open = False
+# Timezone the Power Pugs window is set in until changed with .windowtz
+WINDOW_TIMEZONE = os.environ.get('WINDOW_TIMEZONE', 'America/New_York')
+
 
+# Shared MySQL connection pool. Queries run on the pool's own threads so they
+# never block the event loop.
+db_pool = db.ConnectionPool(db.mysql_connector(DB_HOST, DB_USER, DB_PASSWORD, DB_DB),
+                            max_size=int(os.environ.get('DB_POOL_SIZE', 4)))
 
-def db_connect():
-    db = pymysql.connect(host=DB_HOST, user=DB_USER, 
-                            password=DB_PASSWORD, db=DB_DB, charset='utf8mb4', 
-                            cursorclass=pymysql.cursors.DictCursor, autocommit=True)
-    return db
+# Local Prometheus-style metrics endpoint
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9100))
+
+# FACEIT can post events straight to the bot; only served when a secret is set.
+# The Discord webhook channel keeps working either way.
+WEBHOOK_SECRET  = os.environ.get('WEBHOOK_SECRET')
+WEBHOOK_HOST    = os.environ.get('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT    = int(os.environ.get('WEBHOOK_PORT', 8080))
+
+# Lowercased FACEIT nickname -> Discord name, including negative results for
+# unlinked accounts. Lowercased because MySQL matches nicknames without regard
+# to case, so the same account can come in spelled several ways.
+discord_cache = cache.TTLCache(max_size=4096, ttl=1800, negative_ttl=120)
+
+# league_school abbreviations, loaded on startup and topped up periodically
+school_index = schools.SchoolIndex()
+SCHOOL_REFRESH_MINUTES = 15
+SCHOOL_FULL_RELOAD_HOURS = 6
 
 """
 -------------------------------------------------------------------------------
@@ -85,23 +146,22 @@ def db_connect():
 #
 #   Check if discord user is verified on website
 #
-def is_verified(discord_name):
-    db = db_connect()
+async def is_verified(discord_name):
     try:
-        with db.cursor() as cursor:
-            sql = "select verified_student, faceit, discord, college from users_profile where discord=%s"
-            cursor.execute(sql, (str(discord_name),))
-            result = cursor.fetchone()
-            verified_student = result.get('verified_student')
-            faceit = result.get('faceit')
-            discord = result.get('discord')
-            is_verified.university = result.get('college')
-            print(verified_student, faceit, discord, is_verified.university)
-            
-            if (verified_student and faceit and discord):
-                return True
-            else:
-                return False
+        sql = "select verified_student, faceit, discord, college from users_profile where discord=%s"
+        with metrics.timed('mysql', 'users_profile_by_discord'):
+            result = await db_pool.fetchone(sql, (str(discord_name),))
+        verified_student = result.get('verified_student')
+        faceit = result.get('faceit')
+        discord = result.get('discord')
+        is_verified.university = result.get('college')
+
+        if (verified_student and faceit and discord):
+            # Their FACEIT -> Discord link may have just been created or changed
+            discord_cache.invalidate(faceit.lower())
+            return True
+        else:
+            return False
     except Exception as e:
         print("Unable to SQL for", discord_name, e)
         return False
@@ -110,37 +170,82 @@ def is_verified(discord_name):
 #   Build university tag for user nickname.
 #
 async def create_uni_tag(author, university):
-    db = db_connect()
-    try:
-        with db.cursor() as cursor:
-            sql = "SELECT abbreviation FROM league_school WHERE name =%s;"
-            cursor.execute(sql, (str(university),))
-            result = cursor.fetchone()
-            tag = result.get('abbreviation')
-            await author.send("I added your college tag to your server nickname. Feel free to change it if I made a mistake.")
-    except Exception as e:
-        print("SQL failed, falling back to generation", university, e)
-        tag_words = university.split()
-        tag_letters = [word[0] for word in tag_words]
-        tag = "".join(tag_letters)
+    tag = school_index.lookup(university)
+    if tag != None:
+        await author.send("I added your college tag to your server nickname. Feel free to change it if I made a mistake.")
+    else:
+        print("No school matched, falling back to generation", university)
+        tag = generate_uni_tag(university)
         await author.send("I added your college tag to your server nickname. Unfortunately we don't have one stored for your school so I tried my best to generate it. Feel free to change it if I made a mistake.")
     
-    await author.edit(nick="[{}] {}".format(tag, author.name))
+    await author.edit(nick=tagged_nick(tag, author))
+
+#
+#   Best guess at a tag for schools we don't have an abbreviation for
+#
+def generate_uni_tag(university):
+    return "".join(word[0] for word in university.split())
 
+def tagged_nick(tag, member):
+    return "[{}] {}".format(tag, member.name)
+
+#
+#   Pull new league_school rows into the school index, or reload it all
+#
+async def load_schools(full=False):
+    last_id = 0 if full else school_index.last_id
+    sql = "select id, name, abbreviation from league_school where id > %s"
+    with metrics.timed('mysql', 'league_school_since'):
+        rows = await db_pool.fetchall(sql, (last_id,))
+    if full:
+        school_index.load(rows)
+    else:
+        school_index.add(rows)
+    return len(rows)
+
+#
+#   Query discord usernames for a list of faceit usernames in one round-trip.
 #
-#   Query discord username from faceit username
+#   Returns a dict of faceit -> discord (None if the account isn't linked).
+#   Results, including misses, are cached so repeat players in a session
+#   don't hit the database again.
 #
-def get_discord_from_faceit(faceit):
-    print("Finding", faceit)
-    db = db_connect()
+async def get_discords_from_faceit(players):
+    resolved = {}
+    missing = []
+    for faceit in players:
+        cached = discord_cache.get(faceit.lower())
+        if cached is cache.MISSING:
+            missing.append(faceit)
+        else:
+            resolved[faceit] = cached
+
+    if not missing:
+        return resolved
+
+    print("Finding", missing)
     try:
-        with db.cursor() as cursor:
-            sql = "select discord from users_profile where faceit=%s"
-            cursor.execute(sql, (faceit,))
-            return cursor.fetchone().get('discord')
+        sql = "select faceit, discord from users_profile where faceit in ({})".format(", ".join(["%s"] * len(missing)))
+        with metrics.timed('mysql', 'users_profile_by_faceit'):
+            rows = await db_pool.fetchall(sql, tuple(missing))
     except Exception as e:
-        print("Unable to SQL for", faceit, e)
-        return None
+        print("Unable to SQL for", missing, e)
+        for faceit in missing:
+            resolved[faceit] = None
+        return resolved
+
+    # MySQL compares case-insensitively so match the rows back the same way
+    found = {}
+    for row in rows:
+        if row.get('faceit'):
+            found[row['faceit'].lower()] = row.get('discord') or None
+
+    for faceit in missing:
+        discord_name = found.get(faceit.lower())
+        discord_cache.set(faceit.lower(), discord_name)
+        resolved[faceit] = discord_name
+
+    return resolved
 
 """
 -------------------------------------------------------------------------------
@@ -150,156 +255,217 @@ def get_discord_from_faceit(faceit):
 #
 #   Open or close Power Pugs
 #
-def powerpugs_open(should_open):
-    endpoint = "https://api.faceit.com/queue/v1/queue/5e33533649222000078eb060"
-    payload = { "open": should_open }
-
-    headers = {'Authorization': 'Bearer ' + str(FACEIT_BOT_KEY), 'Content-Type': 'application/json' }
-    response = requests.put(endpoint, json=payload, headers=headers)
-
-    if (response.status_code != 200):
+#   Returns True once FACEIT reports the queue in the requested state
+#
+async def powerpugs_open(should_open):
+    try:
+        await faceit_client.set_queue_open(hubs.POWER_QUEUE_ID, should_open)
+        queue = await faceit_client.queue(hubs.POWER_QUEUE_ID)
+    except faceit_api.FaceitError as e:
         print("Failed to change powerpugs open/close")
-        print(response.content)
+        print(e.status, e.body)
+        return False
+
+    if bool(queue.get('open')) != should_open:
+        print("FACEIT didn't apply powerpugs open/close, queue open is", queue.get('open'))
+        return False
+    return True
 
 
 #
 #   Returns number of people in queue for specified channel
 #
-def get_queue_size(channel_id):
-    if (channel_id == POWER_PUG_CHANNEL):
-        endpoint = FACEIT_QUEUE_API + POWER_QUEUE_ID + "?limit=15"
-    elif (channel_id == GENERAL_CHANNEL):
-        endpoint = FACEIT_QUEUE_API + GENERAL_QUEUE_ID + "?limit=15"
-    else:
-        print("Invalid Channel ID. We shouldn't ever see this.")
+async def get_queue_size(channel_id):
+    hub = routes.by_channel(channel_id)
+    if hub == None:
+        print("No hub for channel", channel_id)
         return None
 
-    headers = {'Authorization': 'Bearer ' + str(FACEIT_BOT_KEY)}
-    num = requests.get(endpoint, headers=headers)
-
-    if (num.status_code != 200):
+    try:
+        players = await faceit_client.queue_players(hub.queue_id, limit=15)
+    except faceit_api.FaceitError as e:
         print("Could not fetch queue size from", channel_id)
-        print("STATUS", num.status_code)
+        print("STATUS", e.status)
         return None
 
-    return len(num.json()['payload'])
+    return len(players)
 
 #
 #   Get ongoing FACEIT matches for specified channel
 #
 #   Returns None if unsuccessful
 #
-def get_ongoing_matches(channel_id):
-    if (channel_id == POWER_PUG_CHANNEL):
-        endpoint = FACEIT_DATA_V4 + "hubs/" + POWER_PUG_HUB + "/matches"
-    elif (channel_id == GENERAL_CHANNEL):
-        endpoint = FACEIT_DATA_V4 + "hubs/" + GENERAL_HUB + "/matches"
-    else:
-        print("Invalid Channel ID. We shouldn't ever see this.")
+async def get_ongoing_matches(channel_id):
+    hub = routes.by_channel(channel_id)
+    if hub == None:
+        print("No hub for channel", channel_id)
         return None
 
-    matches = requests.get(endpoint, params={"type": "ongoing"}, headers=headers)
-
-    if (matches.status_code != 200):
+    try:
+        return await faceit_client.hub_matches(hub.hub_id, match_type='ongoing')
+    except faceit_api.FaceitError as e:
         print("Could not fetch matches from", channel_id)
-        print("STATUS", matches.status_code)
+        print("STATUS", e.status)
         return None
-    return matches.json()
 
 #
 #   Get ongoing FACEIT streams for all of NACCS on FACEIT
 #
-# 
+#   Picks up the stream messages already in the channel instead of purging
+#   it, so a restart costs one history read rather than a mass delete.
+#
 async def preload_streams():
-    channel = client.get_channel(LEAGUE_STREAMS)
+    channel = client.get_channel(hubs.LEAGUE_STREAMS)
+
+    intro = "This channel automatically shows streams from players currently using a NACCS service on FACEIT."
+    intro_text = intro + " I update every {} minutes.".format(STREAM_REFRESH_MINUTES)
+
+    intro_message = await displayed_streams.adopt(channel, client.user, intro=intro)
+    print("Adopted", len(displayed_streams), "stream messages")
+
+    if intro_message == None:
+        await channel.send(intro_text)
+    elif intro_message.content != intro_text:
+        await intro_message.edit(content=intro_text)
 
-    await channel.purge()
-    await channel.send("This channel automatically shows streams from players currently using a NACCS service on FACEIT. I update every 5 minutes.")
+@loop(minutes=1)
+async def prune_db_pool():
+    db_pool.prune()
+
+
+# New schools are picked up every few minutes. Renames and abbreviation
+# changes don't bump the ID, so those wait for the full reload.
+@loop(minutes=SCHOOL_REFRESH_MINUTES)
+async def refresh_schools():
+    full = school_index.loaded_at == None or time.monotonic() - school_index.loaded_at > SCHOOL_FULL_RELOAD_HOURS * 3600
+    try:
+        added = await load_schools(full=full)
+    except Exception as e:
+        print("Could not refresh schools", e)
+        return
+    if full or added:
+        print("Loaded", added, "schools" if full else "new schools")
+
+
+async def fetch_live_streams():
+    return [record async for record in streams.fetch_streams(faceit_client, hubs.STREAM_ORGANIZERS)]
+
+@loop(minutes=STREAM_REFRESH_MINUTES)
+async def get_streams():
+    try:
+        live_streams = await fetch_live_streams()
+    except faceit_api.FaceitError as e:
+        print("Could not fetch streams", e)
+        return
+
+    # Only streams that started, ended or changed cost a Discord call
+    channel = client.get_channel(hubs.LEAGUE_STREAMS)
+    added, edited, removed = await displayed_streams.reconcile(channel, live_streams)
+    if added or edited or removed:
+        print("Streams updated:", added, "added,", edited, "edited,", removed, "removed")
+
+# Hub channel ID -> FACEIT lookups for .matches. Shared across users so a
+# burst of commands costs at most one FACEIT request per hub.
+matches_cache = cache.SingleFlightCache(get_ongoing_matches, ttl=15, stale_ttl=120)
+queue_size_cache = cache.SingleFlightCache(get_queue_size, ttl=10, stale_ttl=60)
+
+# Hub channel ID -> StatusBoard
+status_boards = {}
+
+# Hub name -> pool of reusable team voice channels
+TEAM_SIZE = 5
+channel_pools = {hub.name: pool.ChannelPool(match_store, hub.name, user_limit=TEAM_SIZE) for hub in routes if hub.voice_channels}
+POOL_MAINTAIN_MINUTES = 5
 
 #
-#   Open the Power Pugs queue
+#   Pick up each hub's pooled channels. Runs before recover_matches so
+#   channels of matches that ended while we were down go back to the pool.
 #
-def open_powerpugs():
-    print("Opening Powerpugs")
-    powerpugs_open(True)
-
+async def start_channel_pools():
+    active = set(channel_id for match in match_store.matches() for channel_id in match['channel_ids'])
+    for hub_name, channel_pool in channel_pools.items():
+        hub = routes.by_name(hub_name)
+        category = hub_channel(hub, hub.category_id)
+        if category == None:
+            print("Category for", hub_name, "not found, not pooling its channels")
+            continue
+        await channel_pool.adopt(category.guild, category, active)
+        print("Adopted", len(channel_pool), "pooled channels for", hub_name)
+
+@loop(minutes=POOL_MAINTAIN_MINUTES)
+async def maintain_channel_pools():
+    for hub_name, channel_pool in channel_pools.items():
+        hub = routes.by_name(hub_name)
+        category = hub_channel(hub, hub.category_id)
+        if category == None:
+            continue
+        try:
+            await channel_pool.maintain(category.guild, category)
+        except Exception as e:
+            print("Could not maintain channel pool for", hub_name, repr(e))
 
 #
-#   Close the Power Pugs queue
+#   Start a pinned, self-updating status board in each hub channel
 #
-def close_powerpugs():
-    print("Closing Powerpugs")
-    powerpugs_open(False)
+def start_status_boards():
+    for hub in routes:
+        if not hub.status_board:
+            continue
+        channel_id = hub.channel_id
+        channel = hub_channel(hub, channel_id)
+        if channel == None:
+            print("Status board channel", channel_id, "not found")
+            continue
+
+        async def fetch(channel_id=channel_id):
+            return await asyncio.gather(queue_size_cache.get(channel_id), matches_cache.get(channel_id))
+
+        board = status_boards.get(channel_id)
+        if board == None:
+            board = status_boards[channel_id] = status.StatusBoard(channel, hub.name, fetch)
+        # In gateway mode the poller pushes to the board instead
+        if NACCS_MODE != 'gateway':
+            board.start()
 
-@loop(seconds=1)
-async def powerpugs_timer():
-    schedule.run_pending()
+"""
+-------------------------------------------------------------------------------
+    Split processes
+-------------------------------------------------------------------------------
+"""
+# Live streams as last pushed by the poller, keyed by nickname
+pushed_streams = {}
 
+# Hub channel ID -> {'in_queue': ..., 'matches': ...} as last pushed by the poller
+pushed_hubs = {}
 
-@loop(minutes=5)
-async def get_streams():
-    global displayed_streams
-
-    active_streams = {}
-    response_naccs = requests.get(FACEIT_STREAMINGS_V1_ORGANIZER + NACCS_MAIN)
-    naccs_data = response_naccs.json()
-
-    stream_responses = {0: naccs_data} # Scalability, for multiple APIs. (Since we are only using one now)
-
-    for division in stream_responses:
-        streams_json = stream_responses[division]
-
-        count = 0
-        for x in streams_json: 
-            if isinstance(streams_json[x], list): 
-                count += len(streams_json[x]) 
-        for x in range(count):
-            response_passed = True # Getting data ready for tests to verify json integrity
-            # Check the json for missing key.
-            expected_keys = ['payload', x, 'stream', 'viewers']
-            _streams_json = streams_json
-            for item in expected_keys:
-                try:
-                    _streams_json = _streams_json[item]
-                except KeyError:
-                    response_passed = False
-
-            if (response_passed == False):
-                print("FACEIT API returned incomplete response.")
-            else:
-                response_nick = (streams_json["payload"][x]["userNickname"])
-                response_image = (streams_json["payload"][x]["stream"]["channelLogo"])
-                response_comp_name = (streams_json["payload"][x]["competitionName"])
-                response_channel_url = (streams_json["payload"][x]["stream"]["channelUrl"])
-                response_faction_name = (streams_json["payload"][x]["factionNickname"])
-                response_viewers = (streams_json["payload"][x]["stream"]["viewers"])
-                active_streams[response_nick] = response_nick
-
-                channel = client.get_channel(LEAGUE_STREAMS)
-                embed = Embed(title=response_nick, url=response_channel_url, description=response_comp_name, color=0x5e7aac)
-                embed.set_thumbnail(url=response_image)
-                embed.set_author(name="A NACCS Stream is Live!", icon_url="https://naccs-s3.s3.us-east-2.amazonaws.com/static/assets/headerlogo_small.png")
-                embed.add_field(name="Team", value=response_faction_name, inline=True)
-                embed.add_field(name="Viewers", value=response_viewers, inline=True)
-
-                if response_nick in displayed_streams:
-                    msg = await channel.fetch_message(displayed_streams[response_nick])
-                    await msg.edit(embed=embed)
-                    continue
-                else:
-                    embed_active = await channel.send(embed=embed)
-                    displayed_streams[response_nick] = embed_active.id
+#
+#   Apply an update from the poller process. See poller.py for the messages.
+#
+async def apply_poller_update(message):
+    if message.get('type') == 'streams':
+        poller.apply_streams(pushed_streams, message)
+        channel = client.get_channel(hubs.LEAGUE_STREAMS)
+        added, edited, removed = await displayed_streams.reconcile(channel, list(pushed_streams.values()))
+        if added or edited or removed:
+            print("Streams updated:", added, "added,", edited, "edited,", removed, "removed")
+
+    elif message.get('type') == 'hub':
+        channel_id = message['channel_id']
+        hub_state = pushed_hubs.setdefault(channel_id, {})
+        for field, cached in (('in_queue', queue_size_cache), ('matches', matches_cache)):
+            if field in message:
+                hub_state[field] = message[field]
+                # .matches answers from here while the data is fresh
+                cached.set(channel_id, message[field])
+
+        board = status_boards.get(channel_id)
+        if board != None:
+            await board.push(hub_state.get('in_queue'), hub_state.get('matches'))
 
+    else:
+        print("Unknown poller message", message.get('type'))
 
-    #Check to see if streams have ended, if so, remove the messages
-    stream_over = { k : displayed_streams[k] for k in set(displayed_streams) - set(active_streams) }
-    if stream_over:
-        for key in stream_over:
-            channel = client.get_channel(LEAGUE_STREAMS)
-            msg = await channel.fetch_message(displayed_streams[key])
-            await msg.delete()
-            del displayed_streams[key]
-            stream_over = {}
+poller_listener = ipc.Listener(POLLER_SOCKET, apply_poller_update)
 
 """
 -------------------------------------------------------------------------------
@@ -307,13 +473,49 @@ async def get_streams():
 -------------------------------------------------------------------------------
 """
 #
-#   Get category object by going through all categories
+#   Guild a hub's channels live in
+#
+def hub_guild(hub):
+    guild_id = hub.guild_id or hub_guild_ids.get(hub.name)
+    if guild_id != None:
+        return client.get_guild(guild_id)
+
+    # Not configured: find it once through the category, then remember it
+    category = client.get_channel(hub.category_id)
+    if category == None:
+        return None
+    hub_guild_ids[hub.name] = category.guild.id
+    return category.guild
+
+#
+#   One of a hub's channels (category, lobby, hub channel) by ID
 #
-def get_category(guild, category_id):
-    for category in guild.categories:
-        if category.id == category_id:
-            return category
-    return None
+def hub_channel(hub, channel_id):
+    guild = hub_guild(hub)
+    return guild.get_channel(channel_id) if guild != None else None
+
+def is_tech_crew(member):
+    return any(role.name == 'Tech Crew' for role in member.roles)
+
+#
+#   Look up a member by Discord name without scanning the whole guild
+#
+def find_member(guild, name):
+    index = member_indexes.get(guild.id)
+    if index == None:
+        return guild.get_member_named(name)
+    return index.get(name)
+
+def index_guild(guild):
+    member_indexes[guild.id] = members.MemberIndex(guild.members)
+    print("Indexed", len(member_indexes[guild.id]), "members in", guild.name)
+
+#
+#   Get the lobby voice channel players go back to after a match in a hub
+#
+def get_lobby(hub_name):
+    hub = routes.by_name(hub_name)
+    return hub_channel(hub, hub.lobby_id) if hub != None else None
 
 # On match ready
 
@@ -325,7 +527,6 @@ def get_category(guild, category_id):
 # 6. Move discord ids to appropriate voice channels
 async def match_ready(message, parsed):
     print("Match ready")
-    guild = message.guild
     match_id = parsed.get('match_id')
 
     if match_id in channels:
@@ -334,35 +535,86 @@ async def match_ready(message, parsed):
         print("Match with ID", match_id, "already handled!")
         return
 
-    if parsed.get("hub") == "NACCS Collegiate Queue":
-        category = get_category(guild, GENERAL_CATEGORY)
-    elif parsed.get("hub") == "NACCS Power Pugs":
+    hub = routes.by_name(parsed.get('hub'))
+    if hub == None or not hub.voice_channels:
         return
-        category = get_category(guild, POWER_PUG_CATEGORY)
-    else:
+
+    guild = hub_guild(hub)
+    category = guild.get_channel(hub.category_id) if guild != None else None
+    if category == None:
+        print("Category for", hub.name, "not found")
         return
 
-    channel_list = []
-    for team in parsed.get('teams'):
-        channel = await guild.create_voice_channel(team.get('team_name'), category=category, user_limit=5)
+    # Record the match before creating anything so a crash mid-setup can't
+    # leave channels we don't know about
+    match_store.add_match(match_id, parsed.get('hub'), guild.id)
 
-        for player in team.get('players'):
-            discord_player = get_discord_from_faceit(player)
-            if discord_player == None or discord_player == '':
-                print("Could not find discord name for", player)
-                continue
+    teams = parsed.get('teams')
+    roster = [player for team in teams for player in team.get('players')]
+    discord_players = await get_discords_from_faceit(roster)
 
-            member = guild.get_member_named(discord_player)
-            try:
-                await member.move_to(channel)
-            except:
-                print("Failed to move player", discord_player)
+    # Each team's players start moving as soon as its own channel exists, so
+    # one team's moves overlap the other team's channel creation.
+    channel_pool = channel_pools[hub.name]
+    results = await asyncio.gather(*[setup_team_channel(guild, category, channel_pool, match_id, team, discord_players)
+                                        for team in teams],
+                                    return_exceptions=True)
 
-        channel_list.append(channel)
+    channel_list = []
+    for team, result in zip(teams, results):
+        if isinstance(result, Exception):
+            print("Failed to create channel for", team.get('team_name'), "in match", match_id, result)
+        else:
+            channel_list.append(result)
 
     channels[match_id] = channel_list
+    tracer.setup_done(match_id, parsed.get('hub'))
     return
 
+#
+#   Create a team's voice channel and move its players into it.
+#
+#   Returns the channel. Players that can't be moved are reported and don't
+#   stop the rest of the team from being moved.
+#
+async def setup_team_channel(guild, category, channel_pool, match_id, team, discord_players):
+    channel = await channel_pool.acquire(guild, category, team.get('team_name'))
+    match_store.add_match_channel(match_id, channel.id)
+    tracer.mark(match_id, tracing.CHANNELS_CREATED, last=True)
+
+    moves = []
+    for player in team.get('players'):
+        discord_player = discord_players.get(player)
+        if discord_player == None or discord_player == '':
+            print("Could not find discord name for", player)
+            continue
+
+        member = find_member(guild, discord_player)
+        if member == None:
+            print("Could not find member", discord_player, "in server")
+            continue
+
+        moves.append((discord_player, move_member(member, channel)))
+
+    results = await asyncio.gather(*[move for _, move in moves], return_exceptions=True)
+    failed = [(name, result) for (name, _), result in zip(moves, results) if isinstance(result, Exception)]
+    if failed:
+        print("Failed to move", len(failed), "of", len(moves), "players into", channel.name)
+        for name, error in failed:
+            print("Failed to move player", name, error)
+
+    return channel
+
+def guild_move_limit(guild):
+    move_limit = move_limits.get(guild.id)
+    if move_limit == None:
+        move_limit = move_limits[guild.id] = asyncio.Semaphore(MOVE_CONCURRENCY)
+    return move_limit
+
+async def move_member(member, channel):
+    async with guild_move_limit(member.guild):
+        await member.move_to(channel)
+
 # On match completed or canceled
 
 # 1. Get match ID
@@ -371,52 +623,392 @@ async def match_ready(message, parsed):
 # 4. Delete channels
 async def match_finished(message, parsed):
     print("Match finished")
-    global channels
-    
-    if parsed.get('hub') == 'NACCS Collegiate Queue':
-        lobby_channel = message.guild.get_channel(GENERAL_LOBBY)
-    elif parsed.get('hub') == 'NACCS Power Pugs':
-        lobby_channel = message.guild.get_channel(POWER_PUG_LOBBY)
-    else:
+    hub = routes.by_name(parsed.get('hub'))
+    if hub == None:
+        print("No hub named", parsed.get('hub'))
         return
+    # Without a lobby the channels are still cleaned up, just without moves
+    lobby_channel = hub_channel(hub, hub.lobby_id)
 
     match_id = parsed.get('match_id')
     to_delete = channels.get(match_id)
     if to_delete != None:
-        for d in to_delete:
-            members = d.members
-            for member in members:
-                await member.move_to(lobby_channel)
-            await d.delete()
-        channels.pop(match_id)
+        await teardown_match(match_id, to_delete, lobby_channel, parsed.get('hub'))
     else:
         print("Error! Couldn't find match", match_id)
     return
 
 async def match_cancelled(message, parsed):
     print("Match cancelled")
-    global channels
-
-    if parsed.get('hub') == 'NACCS Collegiate Queue':
-        lobby_channel = message.guild.get_channel(GENERAL_LOBBY)
-    elif parsed.get('hub') == 'NACCS Power Pugs':
-        lobby_channel = message.guild.get_channel(POWER_PUG_LOBBY)
-    else:
+    hub = routes.by_name(parsed.get('hub'))
+    if hub == None:
+        print("No hub named", parsed.get('hub'))
         return
+    # Without a lobby the channels are still cleaned up, just without moves
+    lobby_channel = hub_channel(hub, hub.lobby_id)
 
     match_id = parsed.get('match_id')
     to_delete = channels.get(match_id)
     if to_delete != None:
-        for d in to_delete:
-            members = d.members
-            for member in members:
-                await member.move_to(lobby_channel)
-            await d.delete()
-        channels.pop(match_id)
+        await teardown_match(match_id, to_delete, lobby_channel, parsed.get('hub'))
     else:
         print("Match was cancelled but no channel was to be deleted.")
     return
 
+#
+#   Move everyone back to the lobby and delete the match's channels.
+#
+#   Members and channels that are already gone are skipped, and the match is
+#   forgotten even if some of it couldn't be cleaned up; the reaper picks up
+#   any channel left behind. Without a lobby nobody is moved, since moving
+#   to None would disconnect them.
+#
+async def teardown_match(match_id, to_delete, lobby_channel, hub_name):
+    hub = routes.by_name(hub_name)
+    channel_pool = channel_pools.get(hub_name)
+    category = hub_channel(hub, hub.category_id) if hub != None else None
+    try:
+        for d in to_delete:
+            if lobby_channel != None:
+                for member in d.members:
+                    try:
+                        await move_member(member, lobby_channel)
+                    except HTTPException as e:
+                        print("Could not move", member, "out of", d.name, e)
+
+            try:
+                # Pooled channels are hidden and kept; anything else is deleted
+                if channel_pool != None and category != None and await channel_pool.release(d.guild, category, d):
+                    continue
+                await d.delete()
+            except NotFound:
+                pass
+            except HTTPException as e:
+                print("Could not delete channel", d.id, "of match", match_id, e)
+    finally:
+        channels.pop(match_id, None)
+        match_store.remove_match(match_id)
+        tracer.teardown_done(match_id, hub_name)
+
+# outcome: resumed, ended (cleaned up now) or gone (guild or channels missing)
+RECOVERED_MATCHES = metrics.registry.counter('naccs_recovered_matches_total', 'Stored matches picked up at startup',
+                                            labels=('outcome',))
+
+#
+#   Reload matches that were live when the bot last stopped.
+#
+#   Matches that are still going get their channel objects re-bound into
+#   `channels`. Matches that ended while we were down are cleaned up now.
+#
+async def recover_matches():
+    stored = match_store.matches()
+    if not stored:
+        return
+
+    details = await asyncio.gather(*[faceit_client.match(match['match_id']) for match in stored], return_exceptions=True)
+    for match, detail in zip(stored, details):
+        try:
+            await recover_match(match, detail)
+        except Exception as e:
+            # One bad match mustn't stop the rest of startup
+            print("Could not recover match", match['match_id'], repr(e))
+            sentry_sdk.capture_exception(e)
+
+#
+#   detail is the FACEIT match, or the exception fetching it raised
+#
+async def recover_match(match, detail):
+    match_id = match['match_id']
+    guild = client.get_guild(match['guild_id'])
+    if guild == None:
+        RECOVERED_MATCHES.inc(outcome='gone')
+        match_store.remove_match(match_id)
+        return
+
+    match_channels = [guild.get_channel(channel_id) for channel_id in match['channel_ids']]
+    match_channels = [channel for channel in match_channels if channel != None]
+
+    if isinstance(detail, Exception):
+        # Can't tell if it's over. Keep it so the finished webhook can clean up.
+        print("Could not fetch status for match", match_id, detail)
+        status = None
+    else:
+        status = detail.get('status')
+
+    if status in MATCH_OVER_STATES:
+        RECOVERED_MATCHES.inc(outcome='ended')
+        await teardown_match(match_id, match_channels, get_lobby(match['hub']), match['hub'])
+    elif not match_channels:
+        RECOVERED_MATCHES.inc(outcome='gone')
+        match_store.remove_match(match_id)
+    else:
+        RECOVERED_MATCHES.inc(outcome='resumed')
+        channels[match_id] = match_channels
+
+#
+#   Clean up team channels nothing is tracking any more.
+#
+#   One pass per hub category: matches we still think are live but FACEIT
+#   doesn't list as ongoing are torn down, then any remaining team-sized voice
+#   channel that no match or idle pool slot accounts for is emptied into the
+#   lobby and deleted (or handed back to the pool). The lobby, idle pooled
+#   channels and anything younger than REAP_GRACE are always left alone.
+#
+REAP_MINUTES = 10
+REAP_GRACE = 900
+REAP_BATCH = 5
+REAP_BATCH_PAUSE = 5
+
+REAPED_MATCHES = metrics.registry.counter('naccs_reaped_matches_total', 'Matches torn down after FACEIT stopped listing them')
+REAPED_CHANNELS = metrics.registry.counter('naccs_reaped_channels_total', 'Orphaned team channels cleaned up')
+
+@loop(minutes=REAP_MINUTES)
+async def reap_orphans():
+    for hub in routes:
+        if not hub.voice_channels:
+            continue
+        try:
+            await reap_hub(hub)
+        except Exception as e:
+            print("Reaping", hub.name, "failed", repr(e))
+
+async def reap_hub(hub):
+    category = hub_channel(hub, hub.category_id)
+    if category == None:
+        return
+    # May be None; matches are still torn down and empty orphans deleted
+    lobby = hub_channel(hub, hub.lobby_id)
+    guild = category.guild
+
+    try:
+        ongoing = await faceit_client.hub_matches(hub.hub_id, match_type='ongoing', limit=100, priority=ratelimit.BACKGROUND)
+    except faceit_api.FaceitError as e:
+        # Without FACEIT's view we can't tell a live match from a dead one
+        print("Not reaping", hub.name, "- could not fetch ongoing matches", e.status)
+        return
+    live = set(item['match_id'] for item in ongoing.get('items', []))
+
+    now = time.time()
+    for match in match_store.matches():
+        match_id = match['match_id']
+        if match['hub'] != hub.name or match_id in live or now - match['created_at'] < REAP_GRACE:
+            continue
+        to_delete = channels.get(match_id)
+        if to_delete == None:
+            to_delete = [guild.get_channel(channel_id) for channel_id in match['channel_ids']]
+            to_delete = [channel for channel in to_delete if channel != None]
+        REAPED_MATCHES.inc()
+        await teardown_match(match_id, to_delete, lobby, hub.name)
+
+    channel_pool = channel_pools.get(hub.name)
+    known = set([lobby.id]) if lobby != None else set()
+    known.update(channel_id for match in match_store.matches() for channel_id in match['channel_ids'])
+    known.update(channel.id for match_channels in channels.values() for channel in match_channels)
+    if channel_pool != None:
+        known.update(channel_pool.idle)
+
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=REAP_GRACE)
+    orphans = [channel for channel in category.voice_channels
+                if channel.id not in known and channel.user_limit == TEAM_SIZE and channel.created_at < cutoff]
+    if lobby == None:
+        # Nowhere to move anyone, so occupied channels are left alone
+        orphans = [channel for channel in orphans if not channel.members]
+    if not orphans:
+        return
+
+    REAPED_CHANNELS.inc(len(orphans))
+    for start in range(0, len(orphans), REAP_BATCH):
+        if start:
+            await asyncio.sleep(REAP_BATCH_PAUSE)
+        batch = orphans[start:start + REAP_BATCH]
+        await asyncio.gather(*[reap_channel(guild, category, channel_pool, channel, lobby) for channel in batch],
+                                return_exceptions=True)
+
+async def reap_channel(guild, category, channel_pool, channel, lobby):
+    await asyncio.gather(*[move_member(member, lobby) for member in channel.members], return_exceptions=True)
+    if channel_pool != None and await channel_pool.release(guild, category, channel):
+        return
+    try:
+        await channel.delete()
+    except NotFound:
+        pass
+
+#
+#   Entry point for every FACEIT webhook event, however it reached us.
+#   context is the Discord webhook message, or None for a direct POST.
+#
+async def ingest_event(context, parsed):
+    # Only matches that get voice channels are ever finished off in the
+    # tracer, and a duplicate would reopen a match that already was
+    hub = routes.by_name(parsed['hub'])
+    if hub != None and hub.voice_channels and not event_dispatcher.seen(parsed):
+        if parsed['event'] == events.MATCH_READY:
+            tracer.mark(parsed['match_id'], tracing.READY_RECEIVED)
+        else:
+            tracer.mark(parsed['match_id'], tracing.TEARDOWN_RECEIVED)
+    await event_dispatcher.submit(context, parsed)
+
+"""
+-------------------------------------------------------------------------------
+    Bulk verification
+-------------------------------------------------------------------------------
+"""
+VERIFYALL_BATCH = 50
+VERIFYALL_CONCURRENCY = 3
+VERIFYALL_PROGRESS_SECONDS = 5
+
+# Guild IDs with a .verifyall in progress
+verifyall_running = set()
+
+def verifyall_checkpoint_key(guild):
+    return 'verifyall:{}'.format(guild.id)
+
+#
+#   Work out what a verified member is missing. Returns (roles to add, nick),
+#   either of which may be None.
+#
+#   Members who already have the Member role are left alone otherwise: no Ping
+#   means they opted out with .noping, and any nickname is their choice.
+#
+def verified_member_changes(member, college, member_role, ping_role):
+    if member_role == None or member_role in member.roles:
+        return None, None
+
+    roles = [role for role in (member_role, ping_role) if role != None and role not in member.roles]
+
+    nick = None
+    if member.nick == None and college:
+        tag = school_index.lookup(college) or generate_uni_tag(college)
+        nick = tagged_nick(tag, member)
+
+    return roles, nick
+
+async def apply_verified_member(member, college, member_role, ping_role, limit):
+    async with limit:
+        # Re-check against the member as it is now, not as it was at join time
+        roles, nick = verified_member_changes(member, college, member_role, ping_role)
+        if roles == None:
+            return None, None
+        # add_roles rather than edit(roles=...), which would overwrite any
+        # role change made since the member was read
+        await member.add_roles(*roles, reason="Verified student")
+        if nick != None:
+            await member.edit(nick=nick)
+        return roles, nick
+
+#
+#   Give every verified user in the guild their Member and Ping roles and
+#   college tag.
+#
+#   Verified accounts are streamed from the website in one query and joined
+#   against the member index in memory. Only the members that actually need a
+#   change are kept, then updated in small batches. Progress is checkpointed
+#   after every batch so an interrupted run picks up where it stopped, along
+#   with the accounts that failed so the next run tries them again.
+#
+async def reconcile_verified(guild, report, resume=True):
+    key = verifyall_checkpoint_key(guild)
+    checkpoint = match_store.get_setting(key) if resume else None
+    if checkpoint == None:
+        checkpoint = {'last_id': 0, 'counts': {}}
+    # Only the applied counts carry over; a resumed run rescans from last_id
+    # and retries earlier failures, so those are counted again
+    counts = dict.fromkeys(('scanned', 'absent', 'roles', 'tags', 'failed'), 0)
+    counts.update({name: checkpoint['counts'][name] for name in ('roles', 'tags') if name in checkpoint['counts']})
+    last_id = checkpoint['last_id']
+    retry_ids = set(checkpoint.get('failed_ids', ()))
+
+    member_role = get(guild.roles, name="Member")
+    ping_role = get(guild.roles, name="Ping")
+    if member_role == None:
+        raise RuntimeError("No Member role in " + guild.name)
+
+    # Join first and close the stream before touching Discord, so the
+    # unbuffered cursor isn't left open while we wait on rate limits
+    pending = []
+    since = "id > %s"
+    if retry_ids:
+        since = "(id > %s or id in ({}))".format(", ".join(["%s"] * len(retry_ids)))
+    sql = ("select id, discord, college from users_profile "
+            "where verified_student and faceit <> '' and discord <> '' and " + since + " order by id")
+    with metrics.timed('mysql', 'users_profile_verified_stream'):
+        async for rows in db_pool.stream(sql, (last_id,) + tuple(sorted(retry_ids))):
+            for row in rows:
+                counts['scanned'] += 1
+                member = find_member(guild, row['discord'])
+                if member == None:
+                    counts['absent'] += 1
+                    continue
+                roles, _ = verified_member_changes(member, row['college'], member_role, ping_role)
+                if roles != None:
+                    pending.append((row['id'], member, row['college']))
+
+    await report(counts, len(pending))
+
+    # Earlier failures that still need a change and haven't been retried yet
+    retry_ids = set(user_id for user_id, _, _ in pending if user_id in retry_ids)
+    failed_ids = set()
+
+    limit = asyncio.Semaphore(VERIFYALL_CONCURRENCY)
+    last_report = time.monotonic()
+    for start in range(0, len(pending), VERIFYALL_BATCH):
+        batch = pending[start:start + VERIFYALL_BATCH]
+        results = await asyncio.gather(*[apply_verified_member(member, college, member_role, ping_role, limit)
+                                            for _, member, college in batch],
+                                        return_exceptions=True)
+        for (user_id, member, _), result in zip(batch, results):
+            retry_ids.discard(user_id)
+            if isinstance(result, Exception):
+                counts['failed'] += 1
+                failed_ids.add(user_id)
+                print("Failed to reconcile", member, repr(result))
+                continue
+            roles, nick = result
+            if roles != None:
+                counts['roles'] += 1
+            if nick != None:
+                counts['tags'] += 1
+
+        # Retried IDs sort first, so last_id only ever moves forward
+        last_id = max(last_id, batch[-1][0])
+        match_store.set_setting(key, {'last_id': last_id, 'counts': counts,
+                                        'failed_ids': sorted(retry_ids | failed_ids)})
+
+        remaining = len(pending) - start - len(batch)
+        if remaining and time.monotonic() - last_report >= VERIFYALL_PROGRESS_SECONDS:
+            last_report = time.monotonic()
+            await report(counts, remaining)
+
+    # Keep failures around for the next .verifyall
+    match_store.set_setting(key, {'last_id': last_id, 'counts': {}, 'failed_ids': sorted(failed_ids)} if failed_ids else None)
+    return counts
+
+# Opens and closes the Power Pugs queue on its weekly schedule
+window_scheduler = window.WindowScheduler(match_store, powerpugs_open, WINDOW_TIMEZONE)
+
+# Webhook events are handled off the on_message path, in parallel across
+# matches but strictly in order within a match
+event_dispatcher = events.EventDispatcher({
+    events.MATCH_READY: match_ready,
+    events.MATCH_FINISHED: match_finished,
+    events.MATCH_CANCELLED: match_cancelled,
+}, workers=int(os.environ.get('EVENT_WORKERS', 8)))
+
+metrics.registry.gauge('naccs_event_queue_depth', 'Webhook events waiting for a worker', fn=lambda: event_dispatcher.depth)
+metrics.registry.gauge('naccs_poller_connections', 'Poller processes connected in gateway mode', fn=lambda: poller_listener.connections)
+metrics.registry.gauge('naccs_db_pool_connections', 'Open MySQL connections', fn=lambda: db_pool.size)
+metrics.registry.gauge('naccs_db_pool_idle', 'Idle MySQL connections', fn=lambda: db_pool.idle)
+metrics.registry.gauge('naccs_active_matches', 'Matches with voice channels', fn=lambda: len(channels))
+metrics.registry.gauge('naccs_pool_idle_channels', 'Hidden voice channels waiting for a match',
+                        fn=lambda: sum(len(channel_pool.idle) for channel_pool in channel_pools.values()))
+metrics.registry.gauge('naccs_pool_channels', 'Voice channels owned by the channel pools',
+                        fn=lambda: sum(len(channel_pool) for channel_pool in channel_pools.values()))
+metrics.registry.gauge('naccs_pending_deletions', 'Messages waiting to be cleaned up', fn=lambda: len(message_cleanup))
+metrics.registry.gauge('naccs_displayed_streams', 'Stream embeds shown', fn=lambda: len(displayed_streams))
+
+# Every Discord REST call is timed by route
+metrics.instrument_discord(client.http)
+
 """
 -------------------------------------------------------------------------------
     Discord client commands
@@ -427,27 +1019,17 @@ async def match_cancelled(message, parsed):
                 brief="Turn on Power Pugs Queue Window",
                 pass_context=True)
 async def start_autowindow(context):
-    global window_open
-    if window_open:
+    if not is_tech_crew(context.message.author):
+        return
+
+    if window_scheduler.enabled:
         # Already running
         await context.channel.send('Power Pugs already opened!')
         return
 
-    for role in context.message.author.roles:
-        if role.name == 'Tech Crew':
-            schedule.every().day.at("17:00").do(open_powerpugs)
-            schedule.every().monday.at("22:00").do(close_powerpugs)
-            schedule.every().tuesday.at("22:00").do(close_powerpugs)
-            schedule.every().wednesday.at("22:00").do(close_powerpugs)
-            schedule.every().thursday.at("22:00").do(close_powerpugs)
-            schedule.every().friday.at("23:59").do(close_powerpugs)
-            schedule.every().saturday.at("23:59").do(close_powerpugs)
-            schedule.every().sunday.at("23:59").do(close_powerpugs)
-            powerpugs_timer.start()
-            window_open = True
-
-            await context.channel.send('Opened Power Pugs Window!')
-            return
+    window_scheduler.window.enabled = True
+    window_scheduler.restart()
+    await context.channel.send('Opened Power Pugs Window!')
 
 
 @client.command(name='autowindowoff',
@@ -455,20 +1037,78 @@ async def start_autowindow(context):
                 brief="Turn off Power Pugs Queue Window",
                 pass_context=True)
 async def close_autowindow(context):
-    global window_open
-    if not window_open:
+    if not is_tech_crew(context.message.author):
+        return
+
+    if not window_scheduler.enabled:
         # Already closed
         await context.channel.send('Power Pugs already closed!')
         return
 
-    for role in context.message.author.roles:
-        if role.name == 'Tech Crew':
-            schedule.clear()
-            powerpugs_timer.stop()
-            window_open = False
+    window_scheduler.window.enabled = False
+    window_scheduler.restart()
+    await context.channel.send('Closed Power Pugs Window!')
+
+
+@client.command(name='window',
+                description="Show the Power Pugs queue window schedule",
+                brief="Show the Power Pugs queue window",
+                pass_context=True)
+async def show_window(context):
+    await context.channel.send("```" + describe_window() + "```")
 
-            await context.channel.send('Closed Power Pugs Window!')
-            return
+
+@client.command(name='setwindow',
+                description="Set Power Pugs hours, e.g. '.setwindow weekdays 17:00 22:00' or '.setwindow sun off'",
+                brief="Set the Power Pugs queue window",
+                pass_context=True)
+async def set_window(context, days, open_at, close_at=None):
+    if not is_tech_crew(context.message.author):
+        return
+
+    try:
+        for day in window.parse_days(days):
+            if open_at.lower() == 'off':
+                window_scheduler.window.clear_day(day)
+            else:
+                window_scheduler.window.set_day(day, open_at, close_at or '')
+    except window.WindowError as e:
+        await context.channel.send(str(e))
+        return
+
+    window_scheduler.restart()
+    await context.channel.send("```" + describe_window() + "```")
+
+
+@client.command(name='windowtz',
+                description="Set the timezone Power Pugs hours are in, e.g. '.windowtz America/Chicago'",
+                brief="Set the Power Pugs window timezone",
+                pass_context=True)
+async def set_window_timezone(context, timezone):
+    if not is_tech_crew(context.message.author):
+        return
+
+    try:
+        window_scheduler.window.timezone = window.parse_timezone(timezone)
+    except window.WindowError as e:
+        await context.channel.send(str(e))
+        return
+
+    window_scheduler.restart()
+    await context.channel.send("```" + describe_window() + "```")
+
+
+def describe_window():
+    lines = [window_scheduler.window.describe(), ""]
+    if window_scheduler.enabled:
+        transition = window_scheduler.window.next_transition(datetime.datetime.now(pytz.utc))
+        if transition != None:
+            when, should_open = transition
+            local = when.astimezone(window_scheduler.window.timezone)
+            lines.append("Next {} {}".format("open" if should_open else "close", local.strftime("%a %H:%M %Z")))
+    else:
+        lines.append("Automatic window is off")
+    return "\n".join(lines)
 
 
 @client.command(name='pingme',
@@ -481,7 +1121,7 @@ async def pingme(context):
     role = get(context.guild.roles, name="Ping")
     await author.add_roles(role)
     await author.send("I've given you the Ping role! GLHF!")
-    await context.message.delete(delay=2)
+    message_cleanup.schedule(context.message, delay=2)
 
     return
 
@@ -495,7 +1135,7 @@ async def noping(context):
     role = get(context.guild.roles, name="Ping")
     await author.remove_roles(role)
     await author.send("You no longer have the Ping role.")
-    await context.message.delete(delay=2)
+    message_cleanup.schedule(context.message, delay=2)
 
     return
 
@@ -506,7 +1146,7 @@ async def noping(context):
 async def verify(context):
     author = context.message.author
 
-    if is_verified(author):
+    if await is_verified(author):
         # Assign role
         member_role = get(context.guild.roles, name="Member")
         ping_role = get(context.guild.roles, name="Ping")
@@ -523,34 +1163,70 @@ async def verify(context):
     else:
         await author.send("I couldn't verify you. Make sure that you have verified college credentials and that both your FACEIT and Discord accounts are linked! A common issue people encounter is that the Discord account they link is not the Discord account that's logged into their client. Make sure the Discord account you link is EXACTLY the one you're using right now! If you're sure that you have everything in order, contact NACCS staff.")
 
-    await context.message.delete(delay=2)
+    message_cleanup.schedule(context.message, delay=2)
 
     return
 
 
+@client.command(name='verifyall',
+                description="Give every verified user in the server their Member and Ping roles and college tag. Resumes an interrupted run unless given 'restart'.",
+                brief="Verify everyone in bulk",
+                pass_context=True)
+async def verifyall(context, mode=None):
+    if not is_tech_crew(context.message.author):
+        return
+
+    guild = context.guild
+    if guild.id in verifyall_running:
+        message_cleanup.schedule(await context.channel.send("A .verifyall is already running."), delay=20)
+        return
+
+    def describe(counts, remaining):
+        return ("```Scanned {scanned} verified accounts ({absent} not in server)\n"
+                "Roles added: {roles}  Tags added: {tags}  Failed: {failed}\n"
+                "Remaining: {remaining}```").format(remaining=remaining, **counts)
+
+    progress = await context.channel.send("Looking up verified accounts...")
+
+    async def report(counts, remaining):
+        try:
+            await progress.edit(content=describe(counts, remaining))
+        except Exception as e:
+            print("Failed to update .verifyall progress", e)
+
+    verifyall_running.add(guild.id)
+    try:
+        counts = await reconcile_verified(guild, report, resume=(mode != 'restart'))
+    except Exception as e:
+        print("Bulk verify failed", repr(e))
+        await progress.edit(content="Bulk verify stopped: {}. Run .verifyall again to resume.".format(e))
+        raise
+    finally:
+        verifyall_running.discard(guild.id)
+
+    await progress.edit(content="Done. " + describe(counts, 0))
+
 @client.command(name='matches',
                 description="Show current match status for ongoing pugs in our FACEIT hub.",
                 brief="Show current status of pugs.",
                 pass_context=True)
 async def matches(context):
     channel = context.channel
-    matches = get_ongoing_matches(channel.id)
-    in_queue = get_queue_size(channel.id)
+    matches, in_queue = await asyncio.gather(matches_cache.get(channel.id), queue_size_cache.get(channel.id))
 
-    await channel.send("```Currently in queue: " + str(in_queue) + '```', delete_after=30)
-    
+    message_cleanup.schedule(await channel.send("```Currently in queue: " + str(in_queue) + '```'), delay=30)
 
-    if (len(matches['items']) == 0):
-        await channel.send('There are currently no ongoing matches.', delete_after=20)
+    # Check if our GET request succeeded
+    if (matches == None):
+        message_cleanup.schedule(await channel.send('I had trouble fetching matches :( Notify staff and try again later.'), delay=20)
         # Delete message
-        await context.message.delete(delay=2)
+        message_cleanup.schedule(context.message, delay=2)
         return
 
-    # Check if our GET request succeeded
-    if (matches == None):
-        await channel.send('I had trouble fetching matches :( Notify staff and try again later.', delete_after=20)
+    if (len(matches['items']) == 0):
+        message_cleanup.schedule(await channel.send('There are currently no ongoing matches.'), delay=20)
         # Delete message
-        await context.message.delete(delay=2)
+        message_cleanup.schedule(context.message, delay=2)
         return
 
     for item in matches['items']:
@@ -582,13 +1258,44 @@ async def matches(context):
             score.add_field(name=faction1['name'] + ' (' + faction1_score + ')', value=faction1_roster)
             score.add_field(name=faction2['name'] + ' (' + faction2_score + ')', value=faction2_roster)
     
-        await channel.send(embed=score, delete_after=30)
+        message_cleanup.schedule(await channel.send(embed=score), delay=30)
 
     # Delete message
-    await context.message.delete(delay=2)
+    message_cleanup.schedule(context.message, delay=2)
 
     return
 
+@client.command(name='matchstats',
+                description="Show match setup and teardown latency percentiles over the last N matches",
+                brief="Show match setup/teardown latency",
+                pass_context=True)
+async def matchstats(context, count: int = 50):
+    if not is_tech_crew(context.message.author):
+        return
+
+    count = max(1, min(count, tracer.capacity))
+    lines = ["Last {} matches".format(count)]
+    for label, records, field in (("Channels ready", tracer.setups, 'channels'),
+                                    ("Players moved", tracer.setups, 'setup'),
+                                    ("Teardown", tracer.teardowns, 'teardown')):
+        samples, p = tracer.summary(records, field, count)
+        if samples == 0:
+            lines.append("{:<15} no data".format(label))
+            continue
+        lines.append("{:<15} p50 {:>6.2f}s  p95 {:>6.2f}s  p99 {:>6.2f}s  (n={})".format(label, p[50], p[95], p[99], samples))
+
+    await context.channel.send("```" + "\n".join(lines) + "```")
+
+@client.before_invoke
+async def start_command_timer(context):
+    context.started_at = time.monotonic()
+
+@client.after_invoke
+async def stop_command_timer(context):
+    outcome = 'error' if context.command_failed else 'ok'
+    metrics.HANDLER_LATENCY.observe(time.monotonic() - context.started_at,
+                                    kind='command', name=context.command.name, outcome=outcome)
+
 @client.event
 async def on_message(message):
     # If a user dm's the bot, we want to ignore it.
@@ -597,14 +1304,13 @@ async def on_message(message):
     
     # Catch FACEIT webhook!
     if (message.webhook_id):
-        parsed = json.loads(message.content)
+        try:
+            parsed = events.parse_event(message.content)
+        except events.EventError as e:
+            print("Ignoring webhook message:", e)
+            return
         print(parsed)
-        if (parsed['event'] == "match_status_ready"):
-            await match_ready(message, parsed)
-        elif (parsed['event'] == "match_status_finished"):
-            await match_finished(message, parsed)
-        elif (parsed['event'] == "match_status_cancelled"):
-            await match_cancelled(message, parsed)
+        await ingest_event(message, parsed)
         return
     else:
         # Don't process bot messages
@@ -616,21 +1322,94 @@ async def on_message(message):
 @client.event
 async def on_command_error(context, error):
     if isinstance(error, CommandNotFound):
-        # Wait 3 seconds before deleting because Discord glitches out if we
-        # delete it immediately after user writes the message.
-        await context.message.delete(delay=2)
+        # Wait a couple of seconds before deleting because Discord glitches out
+        # if we delete it immediately after user writes the message.
+        message_cleanup.schedule(context.message, delay=2)
         return
 
     raise error
 
+@client.event
+async def on_member_join(member):
+    index = member_indexes.get(member.guild.id)
+    if index != None:
+        index.add(member)
+
+@client.event
+async def on_member_remove(member):
+    index = member_indexes.get(member.guild.id)
+    if index != None:
+        index.remove(member)
+
+@client.event
+async def on_member_update(before, after):
+    if before.nick != after.nick or before.name != after.name or before.discriminator != after.discriminator:
+        index = member_indexes.get(after.guild.id)
+        if index != None:
+            index.update(after)
+
+@client.event
+async def on_user_update(before, after):
+    # Username changes arrive here rather than per guild
+    for guild_id, index in member_indexes.items():
+        guild = client.get_guild(guild_id)
+        member = guild.get_member(after.id) if guild != None else None
+        if member != None:
+            index.update(member)
+
+@client.event
+async def on_guild_join(guild):
+    index_guild(guild)
+
+@client.event
+async def on_guild_remove(guild):
+    member_indexes.pop(guild.id, None)
+    move_limits.pop(guild.id, None)
+
 @client.event
 async def on_ready():
     global should_preload
+    # Rebuilt on every ready since member events may have been missed while
+    # disconnected
+    for guild in client.guilds:
+        index_guild(guild)
+
     if should_preload:
+        # First load before anything that might need a college tag
+        await refresh_schools.coro()
+        refresh_schools.start()
         await preload_streams()
+        await start_channel_pools()
+        await recover_matches()
+        event_dispatcher.start()
+        # Pick the saved queue window back up
+        window_scheduler.restart()
+        start_status_boards()
+        prune_db_pool.start()
+        maintain_channel_pools.start()
+        reap_orphans.start()
+        asyncio.ensure_future(metrics.measure_loop_lag())
+        try:
+            await metrics.serve(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            print("Could not start metrics endpoint", e)
+        if NACCS_MODE == 'gateway':
+            try:
+                await poller_listener.start()
+            except OSError as e:
+                print("Could not listen for the poller", e)
+        if WEBHOOK_SECRET:
+            try:
+                await webhook.serve(WEBHOOK_SECRET, ingest_event, WEBHOOK_HOST, WEBHOOK_PORT)
+            except OSError as e:
+                print("Could not start webhook endpoint", e)
         should_preload = False
         
-    # Call get_streams() and begin 5 minute timer
+    if NACCS_MODE == 'gateway':
+        print("Bot ready. Streams are updated by the poller.")
+        return
+
+    # Call get_streams() and refresh every STREAM_REFRESH_MINUTES
     print("Bot ready. Starting stream task...")
     await get_streams.start()
 
@@ -0,0 +1,173 @@
+import asyncio
+import os
+
+import sentry_sdk
+
+import faceit_api
+import hubs
+import ipc
+import metrics
+import status
+import streams
+
+"""
+-------------------------------------------------------------------------------
+    Background poller process
+
+    In split mode the FACEIT stream and hub polling runs here, in its own
+    process, so slow responses and big JSON parses never hold up the Discord
+    gateway's event loop. Only changes are sent to the gateway:
+
+    {"type": "streams", "full": bool, "set": [[StreamRecord fields]], "removed": [nickname]}
+        Streams that started or changed, and streams that ended. With full
+        set, "set" is every live stream and anything else is gone.
+
+    {"type": "hub", "channel_id": id, "in_queue": n, "matches": {...}}
+        Queue size and ongoing matches for a hub channel. Either field is
+        left out if it hasn't changed. Matches are compacted with
+        status.compact_matches.
+
+    Run it next to a gateway mode bot with `python poller.py`. It only needs
+    the FACEIT keys, the hub config and the socket path; it never connects to
+    Discord or the website database.
+-------------------------------------------------------------------------------
+"""
+
+
+class Poller:
+    def __init__(self, path, channel_ids, fetch_hub, fetch_streams, stream_interval=120):
+        # fetch_hub: coroutine function(channel_id) -> (in_queue, matches);
+        # either may be None
+        # fetch_streams: coroutine function() -> [StreamRecord]; must raise
+        # rather than return a partial list
+        self.channel_ids = list(channel_ids)
+        self.fetch_hub = fetch_hub
+        self.fetch_streams = fetch_streams
+        self.stream_interval = stream_interval
+        # nickname -> StreamRecord, None until the first successful fetch
+        self.streams = None
+        # Hub channel ID -> last good {'in_queue': ..., 'matches': ...}
+        self.hubs = {}
+        self.publisher = ipc.Publisher(path, self.snapshot)
+
+    def snapshot(self):
+        messages = []
+        if self.streams != None:
+            messages.append({'type': 'streams', 'full': True,
+                                'set': [list(record) for record in self.streams.values()], 'removed': []})
+        for channel_id, fields in self.hubs.items():
+            if fields:
+                messages.append(dict(fields, type='hub', channel_id=channel_id))
+        return messages
+
+    async def run(self):
+        await asyncio.gather(self.publisher.run(), self.poll_streams(),
+                                *[self.poll_hub(channel_id) for channel_id in self.channel_ids])
+
+    async def poll_streams(self):
+        while True:
+            try:
+                records = await self.fetch_streams()
+            except Exception as e:
+                print("Could not fetch streams", repr(e))
+            else:
+                message = self.streams_diff(records)
+                if message['full'] or message['set'] or message['removed']:
+                    await self.publisher.send(message)
+            await asyncio.sleep(self.stream_interval)
+
+    def streams_diff(self, records):
+        live = {record.nickname: record for record in records}
+        # A fresh poller can't know what the gateway is still showing
+        full = self.streams == None
+        previous = self.streams or {}
+        self.streams = live
+        return {'type': 'streams', 'full': full,
+                'set': [list(record) for nickname, record in live.items() if full or previous.get(nickname) != record],
+                'removed': [nickname for nickname in previous if nickname not in live]}
+
+    async def poll_hub(self, channel_id):
+        while True:
+            try:
+                in_queue, matches = await self.fetch_hub(channel_id)
+            except Exception as e:
+                print("Could not poll hub channel", channel_id, repr(e))
+                in_queue = matches = None
+
+            if matches != None:
+                matches = status.compact_matches(matches)
+
+            # A failed fetch keeps the last good value, as the status board does
+            last = self.hubs.setdefault(channel_id, {})
+            changed = {}
+            for field, value in (('in_queue', in_queue), ('matches', matches)):
+                if value != None and last.get(field) != value:
+                    last[field] = changed[field] = value
+
+            if changed:
+                await self.publisher.send(dict(changed, type='hub', channel_id=channel_id))
+            await asyncio.sleep(status.next_interval(in_queue, matches))
+
+
+#
+#   Apply a streams message to the gateway's nickname -> StreamRecord dict
+#
+def apply_streams(live, message):
+    if message.get('full'):
+        live.clear()
+    for nickname in message.get('removed') or ():
+        live.pop(nickname, None)
+    for fields in message.get('set') or ():
+        record = streams.StreamRecord(*fields)
+        live[record.nickname] = record
+
+
+#
+#   Queue size and ongoing matches for a hub. Either is None if FACEIT
+#   couldn't be reached, so the gateway keeps its last good value.
+#
+async def fetch_hub_status(faceit_client, hub):
+    async def queue_size():
+        try:
+            return len(await faceit_client.queue_players(hub.queue_id, limit=15))
+        except faceit_api.FaceitError as e:
+            print("Could not fetch queue size for", hub.name, "STATUS", e.status)
+            return None
+
+    async def ongoing_matches():
+        try:
+            return await faceit_client.hub_matches(hub.hub_id, match_type='ongoing')
+        except faceit_api.FaceitError as e:
+            print("Could not fetch matches for", hub.name, "STATUS", e.status)
+            return None
+
+    return await asyncio.gather(queue_size(), ongoing_matches())
+
+
+async def main():
+    faceit_client = faceit_api.FaceitClient(os.environ.get('FACEIT_KEY'), os.environ.get('FACEIT_BOT_KEY'))
+    routes = hubs.load_routes()
+
+    try:
+        await metrics.serve(os.environ.get('METRICS_HOST', '127.0.0.1'), int(os.environ.get('METRICS_PORT', 9100)))
+    except OSError as e:
+        print("Could not start metrics endpoint", e)
+
+    async def fetch_hub(channel_id):
+        return await fetch_hub_status(faceit_client, routes.by_channel(channel_id))
+
+    async def fetch_streams():
+        return [record async for record in streams.fetch_streams(faceit_client, hubs.STREAM_ORGANIZERS)]
+
+    background = Poller(os.environ.get('POLLER_SOCKET', ipc.DEFAULT_SOCKET),
+                        [hub.channel_id for hub in routes if hub.status_board], fetch_hub, fetch_streams)
+    try:
+        await background.run()
+    finally:
+        await faceit_client.close()
+
+
+if __name__ == '__main__':
+    sentry_sdk.init(dsn=os.environ.get('SENTRY_DSN', ''))
+    print("Poller Starting...")
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,261 @@
+import asyncio
+import collections
+import time
+
+from discord import NotFound, PermissionOverwrite, Role
+
+"""
+-------------------------------------------------------------------------------
+    Match voice channel pool
+
+    Team channels are taken from a pool of idle channels kept in the hub
+    category instead of being created and deleted for every match. Taking a
+    channel renames it and syncs it back to the category's permissions in one
+    edit. Giving it back only hides it, replacing its permission overwrites
+    in one more edit, because Discord allows just two name changes per
+    channel every ten minutes and each reuse should spend only one of them.
+
+    The pool aims to hold enough idle channels for the busiest point of the
+    last couple of hours, plus some headroom. If every idle channel has used
+    up its renames, a new channel is created as before.
+-------------------------------------------------------------------------------
+"""
+
+# Discord's limit on channel name changes
+RENAME_LIMIT = 2
+RENAME_PERIOD = 600
+
+# Seconds to wait on a rename before creating a fresh channel instead. If
+# Discord rate limits the rename anyway, discord.py would otherwise sleep
+# out the full limit while players wait.
+RENAME_TIMEOUT = 10
+
+# Name of channels created ahead of time; they're renamed when first used
+IDLE_NAME = "Match"
+
+
+#
+#   Roles and members whose access has to be taken away to hide a channel:
+#   @everyone, plus whoever the category lets see or join it
+#
+def visible_to(guild, category):
+    targets = [guild.default_role]
+    for target, overwrite in category.overwrites.items():
+        if target != guild.me and target not in targets and (overwrite.read_messages or overwrite.connect):
+            targets.append(target)
+    return targets
+
+
+#
+#   Permissions that hide an idle channel from everyone but the bot
+#
+def hidden_overwrites(guild, category):
+    overwrites = {target: PermissionOverwrite(read_messages=False, connect=False) for target in visible_to(guild, category)}
+    overwrites[guild.me] = PermissionOverwrite(read_messages=True, connect=True, manage_channels=True, move_members=True)
+    return overwrites
+
+
+#
+#   Overwrites in the form Discord takes them when editing a channel.
+#   discord.py 1.2 has no edit(overwrites=...), but passes this through.
+#
+def overwrites_payload(overwrites):
+    payload = []
+    for target, overwrite in overwrites.items():
+        allow, deny = overwrite.pair()
+        payload.append({'id': target.id, 'type': 'role' if isinstance(target, Role) else 'member',
+                        'allow': allow.value, 'deny': deny.value})
+    return payload
+
+
+#
+#   Replace every overwrite on the channel in one request, rather than one
+#   set_permissions call per role
+#
+async def hide(guild, category, channel):
+    await channel.edit(permission_overwrites=overwrites_payload(hidden_overwrites(guild, category)))
+
+
+class ChannelPool:
+    def __init__(self, store, hub, min_idle=2, max_idle=20, headroom=2, window=7200, user_limit=5):
+        # window: seconds of match concurrency history used to size the pool
+        self.store = store
+        self.hub = hub
+        self.min_idle = min_idle
+        self.max_idle = max_idle
+        self.headroom = headroom
+        self.window = window
+        self.user_limit = user_limit
+
+        # channel ID -> channel, for every channel the pool owns
+        self.channels = {}
+        # channel ID -> time.time() it was given back, for idle channels
+        self.idle = {}
+        # channel ID -> recent rename times
+        self.renames = {}
+        # (time.monotonic(), channels in use)
+        self._usage = collections.deque()
+
+    def __contains__(self, channel_id):
+        return channel_id in self.channels
+
+    def __len__(self):
+        return len(self.channels)
+
+    @property
+    def in_use(self):
+        return len(self.channels) - len(self.idle)
+
+    def _save(self, channel):
+        self.store.save_pool_channel(channel.id, self.hub, channel.guild.id, channel.id in self.idle,
+                                        self.idle.get(channel.id, 0), self.renames.get(channel.id, ()))
+
+    def forget(self, channel_id):
+        self.channels.pop(channel_id, None)
+        self.idle.pop(channel_id, None)
+        self.renames.pop(channel_id, None)
+        self.store.remove_pool_channel(channel_id)
+
+    def _can_rename(self, channel_id, now):
+        recent = [at for at in self.renames.get(channel_id, ()) if now - at < RENAME_PERIOD]
+        self.renames[channel_id] = recent
+        return len(recent) < RENAME_LIMIT
+
+    def _record_usage(self):
+        now = time.monotonic()
+        self._usage.append((now, self.in_use))
+        while self._usage and now - self._usage[0][0] > self.window:
+            self._usage.popleft()
+
+    #
+    #   Idle channels wanted right now: enough for the recent peak plus
+    #   headroom, on top of what's already in use
+    #
+    def target_idle(self):
+        peak = max([in_use for _, in_use in self._usage] + [self.in_use])
+        return max(self.min_idle, min(self.max_idle, peak + self.headroom - self.in_use))
+
+    #
+    #   Pick up the pool's channels after a restart. Channels marked in use
+    #   that no stored match refers to are handed back.
+    #
+    async def adopt(self, guild, category, active_channel_ids):
+        for row in self.store.pool_channels(self.hub):
+            channel = guild.get_channel(row['channel_id'])
+            if channel == None:
+                self.store.remove_pool_channel(row['channel_id'])
+                continue
+
+            self.channels[channel.id] = channel
+            self.renames[channel.id] = row['renamed_at']
+            if row['idle']:
+                self.idle[channel.id] = row['released_at']
+            elif channel.id not in active_channel_ids and not channel.members:
+                await self.release(guild, category, channel)
+
+        self._record_usage()
+
+    #
+    #   A channel for a team, renamed and visible, from the pool if possible
+    #
+    async def acquire(self, guild, category, name):
+        now = time.time()
+        # Longest idle first, so renames are spread across the pool
+        for channel_id, _ in sorted(self.idle.items(), key=lambda item: item[1]):
+            if channel_id not in self.idle or not self._can_rename(channel_id, now):
+                continue
+
+            channel = self.channels[channel_id]
+            del self.idle[channel_id]
+            self.renames[channel_id].append(now)
+            self._save(channel)
+            try:
+                await asyncio.wait_for(channel.edit(name=name, user_limit=self.user_limit, sync_permissions=True),
+                                        RENAME_TIMEOUT)
+            except NotFound:
+                self.forget(channel_id)
+                continue
+            except asyncio.TimeoutError:
+                # Discord may have applied the rename before we gave up on
+                # it. Either way it stays counted against the channel; use
+                # the channel if the cached copy shows the new name.
+                current = guild.get_channel(channel_id)
+                if current != None and current.name == name:
+                    self.channels[channel_id] = current
+                    self._record_usage()
+                    return current
+                print("Rename of pooled channel", channel_id, "timed out")
+                self.idle[channel_id] = now
+                self._save(channel)
+                continue
+            except Exception as e:
+                print("Could not reuse pooled channel", channel_id, repr(e))
+                self.idle[channel_id] = now
+                self._save(channel)
+                continue
+
+            self._record_usage()
+            return channel
+
+        channel = await guild.create_voice_channel(name, category=category, user_limit=self.user_limit)
+        self.channels[channel.id] = channel
+        self._save(channel)
+        self._record_usage()
+        return channel
+
+    #
+    #   Hide an emptied channel and put it back in the pool.
+    #
+    #   Returns False if the channel couldn't be pooled and should be deleted
+    #   instead.
+    #
+    async def release(self, guild, category, channel):
+        if channel.id not in self.channels:
+            return False
+
+        try:
+            await hide(guild, category, channel)
+        except NotFound:
+            self.forget(channel.id)
+            return True
+        except Exception as e:
+            print("Could not return channel", channel.id, "to the pool", repr(e))
+            self.forget(channel.id)
+            return False
+
+        self.idle[channel.id] = time.time()
+        self._save(channel)
+        self._record_usage()
+        return True
+
+    #
+    #   Grow or shrink the idle pool towards its target
+    #
+    async def maintain(self, guild, category):
+        for channel_id in list(self.channels):
+            if guild.get_channel(channel_id) == None:
+                self.forget(channel_id)
+
+        self._record_usage()
+        target = self.target_idle()
+
+        while len(self.idle) < target:
+            channel = await guild.create_voice_channel(IDLE_NAME, category=category, user_limit=self.user_limit,
+                                                        overwrites=hidden_overwrites(guild, category))
+            self.channels[channel.id] = channel
+            self.idle[channel.id] = time.time()
+            self._save(channel)
+
+        # Only shrink once well over target, so a quiet hour doesn't cost a
+        # round of deletes followed by a round of creates
+        surplus = len(self.idle) - target - self.headroom
+        if surplus <= 0:
+            return
+
+        for channel_id, _ in sorted(self.idle.items(), key=lambda item: item[1])[:surplus]:
+            channel = self.channels[channel_id]
+            self.forget(channel_id)
+            try:
+                await channel.delete()
+            except NotFound:
+                pass
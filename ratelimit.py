@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+import metrics
+
+"""
+-------------------------------------------------------------------------------
+    FACEIT rate limiting
+
+    One token bucket per FACEIT API family, shared by every caller in the
+    process. Callers that have to wait are served strictly by priority, and
+    lower priorities also have to leave a few tokens in the bucket, so a burst
+    of commands or stream polling can't use up what match handling needs.
+
+    Rate limit headers on responses pull the bucket down to what FACEIT says
+    is left, and a 429 pauses the whole family until Retry-After has passed.
+-------------------------------------------------------------------------------
+"""
+
+# Priorities, most urgent first
+MATCH       = 0
+WINDOW      = 1
+COMMAND     = 2
+BACKGROUND  = 3
+
+PRIORITY_NAMES = {MATCH: 'match', WINDOW: 'window', COMMAND: 'command', BACKGROUND: 'background'}
+
+# Tokens a priority must leave behind when it takes one
+RESERVE = {MATCH: 0, WINDOW: 0, COMMAND: 1, BACKGROUND: 2}
+
+# API family -> (requests per second, burst). FACEIT does not publish limits
+# for the internal queue and stream APIs, so these are deliberately modest.
+DEFAULT_LIMITS = {
+    'data': (10, 20),
+    'queue': (5, 10),
+    'stream': (5, 10),
+}
+
+REMAINING_HEADERS = ('X-RateLimit-Remaining', 'RateLimit-Remaining')
+RESET_HEADERS = ('X-RateLimit-Reset', 'RateLimit-Reset')
+
+
+LIMITER_WAIT = metrics.registry.histogram('naccs_faceit_limiter_wait_seconds',
+                                            'Time FACEIT requests waited for a rate limit token',
+                                            labels=('family', 'priority'))
+LIMITER_TOKENS = metrics.registry.gauge('naccs_faceit_limiter_tokens', 'Tokens left in each FACEIT bucket',
+                                            labels=('family',))
+LIMITER_WAITING = metrics.registry.gauge('naccs_faceit_limiter_waiting', 'FACEIT requests waiting for a token',
+                                            labels=('family', 'priority'))
+LIMITER_THROTTLED = metrics.registry.counter('naccs_faceit_limiter_throttled_total',
+                                                'Times FACEIT told us to slow down',
+                                                labels=('family', 'reason'))
+
+
+def _header_number(headers, names):
+    for name in names:
+        try:
+            return float(headers.get(name))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class TokenBucket:
+    def __init__(self, family, rate, burst):
+        self.family = family
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+        # (priority, arrival, future), most urgent and then oldest first
+        self._waiters = []
+        self._arrivals = itertools.count()
+        self._task = None
+        self._wake = None
+
+    @property
+    def waiting(self):
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    #
+    #   Seconds until `priority` may take a token, 0 if it can right now
+    #
+    def _delay(self, priority):
+        now = self._refill()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+
+        needed = min(1 + RESERVE.get(priority, 0), self.burst)
+        if self.tokens >= needed:
+            return 0
+        return (needed - self.tokens) / self.rate
+
+    def _take(self):
+        self.tokens -= 1
+        LIMITER_TOKENS.set(round(self.tokens, 2), family=self.family)
+
+    def _report_waiting(self):
+        counts = dict.fromkeys(PRIORITY_NAMES, 0)
+        for priority, _, future in self._waiters:
+            if not future.done():
+                counts[priority] = counts.get(priority, 0) + 1
+        for priority, count in counts.items():
+            LIMITER_WAITING.set(count, family=self.family, priority=PRIORITY_NAMES.get(priority, priority))
+
+    async def acquire(self, priority=BACKGROUND):
+        started = time.monotonic()
+        if not self._waiters and self._delay(priority) == 0:
+            self._take()
+        else:
+            future = asyncio.get_event_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+            self._report_waiting()
+            if self._task == None or self._task.done():
+                self._task = asyncio.ensure_future(self._serve())
+            elif self._wake != None and not self._wake.done():
+                # The server may be sleeping for a less urgent waiter
+                self._wake.set_result(None)
+
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just as we were cancelled; hand the token back
+                    self.tokens = min(self.burst, self.tokens + 1)
+                self._report_waiting()
+                raise
+
+        LIMITER_WAIT.observe(time.monotonic() - started, family=self.family,
+                                priority=PRIORITY_NAMES.get(priority, priority))
+
+    async def _serve(self):
+        loop = asyncio.get_event_loop()
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+
+            delay = self._delay(priority)
+            if delay > 0:
+                self._wake = loop.create_future()
+                await asyncio.wait([self._wake], timeout=delay)
+                continue
+
+            heapq.heappop(self._waiters)
+            self._take()
+            future.set_result(None)
+            self._report_waiting()
+
+        self._report_waiting()
+
+    #
+    #   Stop handing out tokens for `seconds`
+    #
+    def pause(self, seconds, reason):
+        LIMITER_THROTTLED.inc(family=self.family, reason=reason)
+        self._refill()
+        self.tokens = 0
+        self._blocked_until = max(self._blocked_until, time.monotonic() + max(0, seconds))
+        LIMITER_TOKENS.set(0, family=self.family)
+
+    #
+    #   Trust FACEIT's count of what's left over our own
+    #
+    def update(self, headers):
+        remaining = _header_number(headers, REMAINING_HEADERS)
+        if remaining == None:
+            return
+
+        self._refill()
+        self.tokens = min(self.tokens, remaining)
+        LIMITER_TOKENS.set(round(self.tokens, 2), family=self.family)
+        if remaining < 1:
+            reset = _header_number(headers, RESET_HEADERS)
+            if reset == None:
+                reset = 1 / self.rate
+            elif reset > 1e9:
+                # Epoch timestamp rather than seconds from now
+                reset -= time.time()
+            self.pause(reset, 'exhausted')
+
+
+class RateLimiter:
+    def __init__(self, limits=None):
+        self.buckets = {family: TokenBucket(family, rate, burst)
+                        for family, (rate, burst) in (limits or DEFAULT_LIMITS).items()}
+
+    def bucket(self, family):
+        return self.buckets[family]
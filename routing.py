@@ -0,0 +1,98 @@
+import json
+from collections import namedtuple
+
+"""
+-------------------------------------------------------------------------------
+    Hub routing
+
+    Which FACEIT hub goes with which queue, Discord guild, match category,
+    lobby and hub channel. Loaded once from config and indexed by hub name
+    (what webhooks carry), hub ID and hub channel ID, so every lookup is a
+    dict hit instead of an if/elif chain.
+-------------------------------------------------------------------------------
+"""
+
+# name: hub display name, as sent in webhook events
+# guild_id: None to use whichever guild the category is in
+# voice_channels: create team voice channels on match ready
+# status_board: keep a pinned status board in channel_id
+Hub = namedtuple('Hub', ['name', 'hub_id', 'queue_id', 'guild_id', 'category_id',
+                            'lobby_id', 'channel_id', 'voice_channels', 'status_board'])
+
+HUB_DEFAULTS = {'guild_id': None, 'voice_channels': True, 'status_board': True}
+
+
+class RoutingError(ValueError):
+    pass
+
+
+def parse_hub(entry):
+    if not isinstance(entry, dict):
+        raise RoutingError("Hub entries must be objects, got {!r}".format(entry))
+
+    values = dict(HUB_DEFAULTS)
+    values.update(entry)
+    missing = [field for field in Hub._fields if field not in values]
+    if missing:
+        raise RoutingError("Hub {!r} is missing {}".format(entry.get('name'), ", ".join(missing)))
+    unknown = [field for field in values if field not in Hub._fields]
+    if unknown:
+        raise RoutingError("Hub {!r} has unknown fields {}".format(entry.get('name'), ", ".join(unknown)))
+
+    for field in ('guild_id', 'category_id', 'lobby_id', 'channel_id'):
+        # Empty strings come from unset-but-present env vars like GUILD_ID=
+        if values[field] == '':
+            values[field] = None
+        if values[field] != None:
+            try:
+                values[field] = int(values[field])
+            except (TypeError, ValueError):
+                raise RoutingError("Hub {!r} has a non-numeric {}: {!r}".format(entry.get('name'), field, values[field]))
+    return Hub(**values)
+
+
+class RoutingTable:
+    def __init__(self, hubs):
+        self.hubs = list(hubs)
+        self._by_name = {}
+        self._by_id = {}
+        self._by_channel = {}
+        for hub in self.hubs:
+            for index, key in ((self._by_name, hub.name), (self._by_id, hub.hub_id), (self._by_channel, hub.channel_id)):
+                if key in index:
+                    raise RoutingError("Hubs {!r} and {!r} both use {!r}".format(index[key].name, hub.name, key))
+                index[key] = hub
+
+    #
+    #   config: {"hubs": [{"name": ..., "hub_id": ..., ...}, ...]}
+    #
+    @classmethod
+    def from_config(cls, config):
+        hubs = config.get('hubs')
+        if not isinstance(hubs, list) or not hubs:
+            raise RoutingError("Routing config needs a non-empty 'hubs' list")
+        return cls(parse_hub(entry) for entry in hubs)
+
+    @classmethod
+    def from_file(cls, path):
+        try:
+            with open(path) as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            raise RoutingError("Could not read routing config {}: {}".format(path, e))
+        return cls.from_config(config)
+
+    def __iter__(self):
+        return iter(self.hubs)
+
+    def __len__(self):
+        return len(self.hubs)
+
+    def by_name(self, name):
+        return self._by_name.get(name)
+
+    def by_id(self, hub_id):
+        return self._by_id.get(hub_id)
+
+    def by_channel(self, channel_id):
+        return self._by_channel.get(channel_id)
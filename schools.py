@@ -0,0 +1,176 @@
+import difflib
+import re
+import time
+
+"""
+-------------------------------------------------------------------------------
+    School abbreviation index
+
+    In-memory copy of league_school for college tags. Names are normalized
+    (case, punctuation, "Univ." style abbreviations, filler words) so common
+    variants match exactly. Anything else falls back to a fuzzy match on the
+    sorted tokens, using only schools that share a token with the query.
+-------------------------------------------------------------------------------
+"""
+
+ABBREVIATIONS = {
+    'univ': 'university',
+    'uni': 'university',
+    'u': 'university',
+    'coll': 'college',
+    'inst': 'institute',
+    'tech': 'technology',
+    'cc': 'community college',
+    'mt': 'mount',
+    'ft': 'fort',
+    'n': 'north',
+    's': 'south',
+    'e': 'east',
+    'w': 'west',
+}
+
+STOPWORDS = {'of', 'the', 'at', 'and', 'in'}
+
+# "St." is "State" only at the end ("Ohio St."); elsewhere it's usually
+# "Saint" ("St. John's") and is left as it is
+TRAILING_ABBREVIATIONS = {'st': 'state'}
+
+# Minimum similarity of the sorted-token strings for a fuzzy match, and of
+# each pair of tokens within it. A fuzzy match never adds or drops a word,
+# so "University of Texas" can't turn into "Texas A&M University".
+MIN_RATIO = 0.88
+MIN_TOKEN_RATIO = 0.75
+
+# Tokens in more than this share of schools ("university", "state") don't
+# narrow the search, so they aren't used to pick candidates
+COMMON_TOKEN_SHARE = 0.2
+
+
+def tokens(name):
+    words = re.sub(r"[^a-z0-9& ]+", " ", name.lower().replace("'", "")).replace("&", " and ").split()
+    if words and words[-1] in TRAILING_ABBREVIATIONS:
+        words[-1] = TRAILING_ABBREVIATIONS[words[-1]]
+    expanded = []
+    for word in words:
+        expanded.extend(ABBREVIATIONS.get(word, word).split())
+    return [word for word in expanded if word not in STOPWORDS]
+
+
+def normalize(name):
+    return " ".join(sorted(tokens(name)))
+
+
+class SchoolIndex:
+    def __init__(self, rows=()):
+        self.last_id = 0
+        # time.monotonic() of the last full load, None until there's been one
+        self.loaded_at = None
+        self._by_name = {}
+        # normalized name -> {school name: abbreviation}. Different schools
+        # can normalize the same way ("Miami University", "University of
+        # Miami"), and then the key can't be trusted to pick one.
+        self._by_key = {}
+        self._by_token = {}
+        if rows:
+            self.load(rows)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    #
+    #   Replace the index with rows of id, name and abbreviation
+    #
+    def load(self, rows):
+        self.last_id = 0
+        self._by_name.clear()
+        self._by_key.clear()
+        self._by_token.clear()
+        self.add(rows)
+        self.loaded_at = time.monotonic()
+
+    #
+    #   Add new or changed rows on top of what's loaded
+    #
+    def add(self, rows):
+        for row in rows:
+            name, abbreviation = row['name'], row['abbreviation']
+            self.last_id = max(self.last_id, row['id'])
+            if not name or not abbreviation:
+                continue
+
+            self._by_name[name] = abbreviation
+            key = normalize(name)
+            if not key:
+                continue
+            schools = self._by_key.setdefault(key, {})
+            was_ambiguous = len(set(schools.values())) > 1
+            schools[name] = abbreviation
+            if not was_ambiguous and len(set(schools.values())) > 1:
+                print("Schools", sorted(schools), "normalize alike, not matching them by name variants")
+            for token in key.split():
+                self._by_token.setdefault(token, set()).add(key)
+
+    #
+    #   Abbreviation for a normalized name, None if unknown or ambiguous
+    #
+    def _abbreviation(self, key):
+        abbreviations = set(self._by_key.get(key, {}).values())
+        return abbreviations.pop() if len(abbreviations) == 1 else None
+
+    def _candidates(self, query_tokens):
+        limit = max(1, int(len(self._by_key) * COMMON_TOKEN_SHARE))
+        candidates = set()
+        common = set()
+        for token in query_tokens:
+            keys = self._by_token.get(token)
+            if keys == None:
+                # Probably a typo; use the closest known spelling instead
+                close = difflib.get_close_matches(token, self._by_token.keys(), n=2, cutoff=0.8)
+                keys = set().union(*[self._by_token[word] for word in close]) if close else set()
+            if len(keys) > limit:
+                common |= keys
+            else:
+                candidates |= keys
+        return candidates or common
+
+    #
+    #   Abbreviation for a college name, or None if nothing is close enough
+    #
+    def lookup(self, name):
+        if not name:
+            return None
+
+        abbreviation = self._by_name.get(name)
+        if abbreviation != None:
+            return abbreviation
+
+        key = normalize(name)
+        if not key:
+            return None
+        if key in self._by_key:
+            # Ambiguous keys return None so the caller generates a tag
+            # rather than guessing between schools
+            return self._abbreviation(key)
+
+        query_tokens = key.split()
+        best, best_ratio, tied = None, 0, False
+        matcher = difflib.SequenceMatcher(b=key, autojunk=False)
+        for candidate in self._candidates(query_tokens):
+            candidate_tokens = candidate.split()
+            if len(candidate_tokens) != len(query_tokens) or self._abbreviation(candidate) == None:
+                continue
+            matcher.set_seq1(candidate)
+            if matcher.real_quick_ratio() < MIN_RATIO or matcher.quick_ratio() < MIN_RATIO:
+                continue
+            if any(difflib.SequenceMatcher(a=ours, b=theirs, autojunk=False).ratio() < MIN_TOKEN_RATIO
+                    for ours, theirs in zip(candidate_tokens, query_tokens)):
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best, best_ratio, tied = candidate, ratio, False
+            elif ratio == best_ratio and self._abbreviation(candidate) != self._abbreviation(best):
+                tied = True
+
+        if best == None or best_ratio < MIN_RATIO or tied:
+            return None
+        return self._abbreviation(best)
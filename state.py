@@ -0,0 +1,117 @@
+import json
+import sqlite3
+import time
+
+"""
+-------------------------------------------------------------------------------
+    Local bot state
+
+    Small SQLite store for state that has to survive a restart. Writes happen
+    before the Discord side effect they describe (write-ahead), so after a
+    crash we know about every channel we may have created.
+-------------------------------------------------------------------------------
+"""
+
+SCHEMA = """
+create table if not exists matches (
+    match_id    text primary key,
+    hub         text not null,
+    guild_id    integer not null,
+    created_at  real not null
+);
+create table if not exists match_channels (
+    match_id    text not null references matches(match_id) on delete cascade,
+    channel_id  integer not null,
+    primary key (match_id, channel_id)
+);
+create table if not exists pool_channels (
+    channel_id      integer primary key,
+    hub             text not null,
+    guild_id        integer not null,
+    idle            integer not null,
+    released_at     real not null default 0,
+    renamed_at      text not null default '[]'
+);
+create table if not exists settings (
+    key         text primary key,
+    value       text not null
+);
+"""
+
+
+class StateStore:
+    def __init__(self, path):
+        self.path = path
+        # Autocommit; every statement here is its own small transaction
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=normal")
+        self.conn.execute("pragma foreign_keys=on")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    #
+    #   Matches
+    #
+    def add_match(self, match_id, hub, guild_id):
+        self.conn.execute("insert or ignore into matches (match_id, hub, guild_id, created_at) values (?, ?, ?, ?)",
+                            (match_id, hub, guild_id, time.time()))
+
+    def add_match_channel(self, match_id, channel_id):
+        self.conn.execute("insert or ignore into match_channels (match_id, channel_id) values (?, ?)",
+                            (match_id, channel_id))
+
+    def remove_match(self, match_id):
+        self.conn.execute("delete from matches where match_id = ?", (match_id,))
+
+    #
+    #   Returns a list of dicts with match_id, hub, guild_id, created_at and
+    #   channel_ids
+    #
+    def matches(self):
+        matches = {}
+        for row in self.conn.execute("select * from matches order by created_at"):
+            match = dict(row)
+            match['channel_ids'] = []
+            matches[match['match_id']] = match
+
+        for row in self.conn.execute("select match_id, channel_id from match_channels"):
+            if row['match_id'] in matches:
+                matches[row['match_id']]['channel_ids'].append(row['channel_id'])
+
+        return list(matches.values())
+
+    #
+    #   Pooled voice channels. renamed_at is a list of recent rename times,
+    #   since Discord only allows a couple of renames per channel in a window.
+    #
+    def save_pool_channel(self, channel_id, hub, guild_id, idle, released_at, renamed_at):
+        self.conn.execute("insert or replace into pool_channels (channel_id, hub, guild_id, idle, released_at, renamed_at) "
+                            "values (?, ?, ?, ?, ?, ?)",
+                            (channel_id, hub, guild_id, 1 if idle else 0, released_at, json.dumps(list(renamed_at))))
+
+    def remove_pool_channel(self, channel_id):
+        self.conn.execute("delete from pool_channels where channel_id = ?", (channel_id,))
+
+    def pool_channels(self, hub):
+        rows = self.conn.execute("select * from pool_channels where hub = ?", (hub,))
+        channels = []
+        for row in rows:
+            channel = dict(row)
+            channel['idle'] = bool(channel['idle'])
+            channel['renamed_at'] = json.loads(channel['renamed_at'])
+            channels.append(channel)
+        return channels
+
+    #
+    #   Settings, stored as JSON
+    #
+    def get_setting(self, key, default=None):
+        row = self.conn.execute("select value from settings where key = ?", (key,)).fetchone()
+        return default if row == None else json.loads(row['value'])
+
+    def set_setting(self, key, value):
+        self.conn.execute("insert or replace into settings (key, value) values (?, ?)", (key, json.dumps(value)))
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+
+from discord import Embed, NotFound, HTTPException
+
+"""
+-------------------------------------------------------------------------------
+    Live hub status board
+
+    One pinned message per hub channel showing queue size and ongoing
+    matches. It is edited in place, and only when what it shows changes.
+    Polling speeds up while people are queueing or playing and slows down
+    when the hub is idle.
+-------------------------------------------------------------------------------
+"""
+
+BOARD_AUTHOR = "NACCS Hub Status"
+BOARD_COLOR = 0x5e7aac
+
+# Seconds between polls
+ACTIVE_INTERVAL     = 15     # someone is in queue
+PLAYING_INTERVAL    = 60     # matches running, queue empty
+IDLE_INTERVAL       = 300    # nothing happening
+ERROR_INTERVAL      = 120    # last poll failed
+
+
+#
+#   One line per match: teams, then map/server once the veto is done
+#
+def describe_match(item):
+    faction1 = item['teams']['faction1']
+    faction2 = item['teams']['faction2']
+    title = faction1['name'] + ' vs. ' + faction2['name']
+
+    if item['status'] != 'ONGOING' and item['status'] != 'READY':
+        detail = "Vote in progress"
+    else:
+        detail = item['voting']['location']['pick'][0] + ' | ' + item['voting']['map']['pick'][0]
+
+    url = str(item['faceit_url']).replace('{lang}', 'en')
+    return title, "[{}]({})".format(detail, url)
+
+
+def render_board(hub_name, in_queue, matches):
+    embed = Embed(title=hub_name, color=BOARD_COLOR)
+    embed.set_author(name=BOARD_AUTHOR)
+    embed.add_field(name="Currently in queue", value=str(in_queue) if in_queue != None else "Unknown", inline=False)
+
+    items = (matches or {}).get('items') or []
+    if matches == None:
+        embed.description = "I had trouble fetching matches :("
+    elif not items:
+        embed.description = "There are currently no ongoing matches."
+    else:
+        embed.description = "{} ongoing match{}".format(len(items), "" if len(items) == 1 else "es")
+        # Discord caps embeds at 25 fields
+        for item in items[:24]:
+            try:
+                title, detail = describe_match(item)
+            except (KeyError, IndexError, TypeError):
+                continue
+            embed.add_field(name=title, value=detail, inline=False)
+
+    return embed
+
+
+#
+#   Seconds until the next poll, given what the last one returned
+#
+def next_interval(in_queue, matches):
+    if in_queue == None or matches == None:
+        return ERROR_INTERVAL
+    if in_queue > 0:
+        return ACTIVE_INTERVAL
+    if matches.get('items'):
+        return PLAYING_INTERVAL
+    return IDLE_INTERVAL
+
+
+#
+#   Strip a hub matches response down to what the board and .matches show,
+#   so it's cheap to compare and to send between processes
+#
+def compact_matches(matches):
+    items = []
+    for item in (matches or {}).get('items') or []:
+        try:
+            teams = item['teams']
+            compact = {
+                'status': item['status'],
+                'faceit_url': item['faceit_url'],
+                'teams': {faction: {'name': teams[faction]['name'],
+                                    'roster': [{'nickname': player['nickname']} for player in teams[faction].get('roster') or []]}
+                            for faction in ('faction1', 'faction2')},
+            }
+        except (KeyError, TypeError):
+            continue
+
+        voting = item.get('voting')
+        if isinstance(voting, dict):
+            compact['voting'] = {key: {'pick': voting[key].get('pick')}
+                                    for key in ('location', 'map') if isinstance(voting.get(key), dict)}
+        items.append(compact)
+    return {'items': items}
+
+
+def embed_hash(embed):
+    return hashlib.sha1(json.dumps(embed.to_dict(), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class StatusBoard:
+    def __init__(self, channel, hub_name, fetch):
+        # fetch: coroutine function() -> (in_queue, matches); either may be None.
+        # Unused if the board is only ever pushed to.
+        self.channel = channel
+        self.hub_name = hub_name
+        self.fetch = fetch
+        self.message = None
+        self._shown = None
+        self._task = None
+        self._adopted = False
+
+    def start(self):
+        if self._task == None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self._task != None:
+            self._task.cancel()
+
+    async def run(self):
+        await self._find_message()
+        while True:
+            try:
+                interval = await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("Status board refresh failed for", self.hub_name, repr(e))
+                interval = ERROR_INTERVAL
+            await asyncio.sleep(interval)
+
+    #
+    #   Poll once, edit the board if needed and return seconds until next poll
+    #
+    async def refresh(self):
+        in_queue, matches = await self.fetch()
+        return await self.update(in_queue, matches)
+
+    #
+    #   Show the given state, editing the board only if it changed, and
+    #   return seconds until the next poll
+    #
+    async def update(self, in_queue, matches):
+        embed = render_board(self.hub_name, in_queue, matches)
+        digest = embed_hash(embed)
+
+        if digest != self._shown or self.message == None:
+            await self._show(embed)
+            self._shown = digest
+
+        return next_interval(in_queue, matches)
+
+    #
+    #   For boards fed by the poller process instead of polling themselves
+    #
+    async def push(self, in_queue, matches):
+        if not self._adopted:
+            await self._find_message()
+        await self.update(in_queue, matches)
+
+    async def _show(self, embed):
+        if self.message != None:
+            try:
+                await self.message.edit(embed=embed)
+                return
+            except NotFound:
+                self.message = None
+
+        self.message = await self.channel.send(embed=embed)
+        try:
+            await self.message.pin()
+        except HTTPException as e:
+            print("Could not pin status board in", self.channel, e)
+
+    #
+    #   Reuse the board we pinned before a restart
+    #
+    async def _find_message(self):
+        self._adopted = True
+        try:
+            pins = await self.channel.pins()
+        except HTTPException as e:
+            print("Could not read pins in", self.channel, e)
+            return
+
+        me = self.channel.guild.me
+        for message in pins:
+            if message.author.id == me.id and message.embeds and message.embeds[0].author.name == BOARD_AUTHOR:
+                self.message = message
+                self._shown = embed_hash(message.embeds[0])
+                return
@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+from collections import namedtuple
+
+from discord import Embed, NotFound, HTTPException
+
+import faceit_api
+
+"""
+-------------------------------------------------------------------------------
+    League stream embeds
+
+    StreamReconciler owns the stream messages in the LEAGUE_STREAMS channel.
+    It keeps the live Message objects and a hash of what each one currently
+    shows, so a refresh only talks to Discord for streams that started,
+    ended, or actually changed.
+-------------------------------------------------------------------------------
+"""
+
+STREAM_AUTHOR = "A NACCS Stream is Live!"
+STREAM_ICON = "https://naccs-s3.s3.us-east-2.amazonaws.com/static/assets/headerlogo_small.png"
+STREAM_COLOR = 0x5e7aac
+
+# Shown for fields FACEIT leaves out; Discord rejects embed fields without a value
+PLACEHOLDER = "—"
+
+StreamRecord = namedtuple('StreamRecord', ['nickname', 'channel_url', 'image', 'competition', 'team', 'viewers'])
+
+
+#
+#   Validate one streamings entry and reduce it to what we render.
+#
+#   Returns None if FACEIT sent an incomplete entry.
+#
+def parse_stream(entry):
+    try:
+        stream = entry['stream']
+        return StreamRecord(nickname=entry['userNickname'],
+                            channel_url=stream['channelUrl'],
+                            image=stream.get('channelLogo'),
+                            competition=entry.get('competitionName') or PLACEHOLDER,
+                            team=entry.get('factionNickname') or PLACEHOLDER,
+                            viewers=stream['viewers'] if stream['viewers'] != None else PLACEHOLDER)
+    except (KeyError, TypeError):
+        return None
+
+
+#
+#   Yield a StreamRecord for every live stream across the given organizers.
+#
+#   Each organizer is paged through until FACEIT returns a short page, with
+#   at most `concurrency` page requests in flight across all organizers.
+#   Raises FaceitError if any page can't be fetched or makes no sense, since
+#   a partial list would make the reconciler take down streams that are
+#   still live. Callers skip that pass and try again next time.
+#
+async def fetch_streams(faceit_client, organizer_ids, page_size=40, concurrency=4, max_pages=25):
+    pages = asyncio.Queue()
+    limit = asyncio.Semaphore(concurrency)
+    done = object()
+
+    async def page_through(organizer_id):
+        try:
+            for page_number in range(max_pages):
+                async with limit:
+                    response = await faceit_client.streamings(organizer_id, limit=page_size, offset=page_number * page_size)
+                page = response.get('payload') or []
+                if not isinstance(page, list):
+                    raise faceit_api.FaceitError("Streamings payload for {} is not a list".format(organizer_id))
+                await pages.put(page)
+                if len(page) < page_size:
+                    break
+            else:
+                print("Stopped paging streams for", organizer_id, "after", max_pages, "pages")
+        except faceit_api.FaceitError as e:
+            await pages.put(e)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Anything else still means the list would be incomplete
+            await pages.put(faceit_api.FaceitError("Could not page streams for {}: {!r}".format(organizer_id, e)))
+        finally:
+            await pages.put(done)
+
+    tasks = [asyncio.ensure_future(page_through(organizer_id)) for organizer_id in organizer_ids]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            page = await pages.get()
+            if page is done:
+                remaining -= 1
+                continue
+            if isinstance(page, Exception):
+                raise page
+
+            for entry in page:
+                record = parse_stream(entry)
+                if record == None:
+                    print("FACEIT API returned incomplete stream entry.")
+                    continue
+                yield record
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def render_embed(record):
+    embed = Embed(title=record.nickname, url=record.channel_url, description=record.competition, color=STREAM_COLOR)
+    # discord.py would send a missing logo as the string "None", which
+    # Discord rejects
+    if record.image:
+        embed.set_thumbnail(url=record.image)
+    embed.set_author(name=STREAM_AUTHOR, icon_url=STREAM_ICON)
+    embed.add_field(name="Team", value=record.team, inline=True)
+    embed.add_field(name="Viewers", value=record.viewers, inline=True)
+    return embed
+
+
+#
+#   Turn one of our own stream embeds back into the record it was rendered from
+#
+def parse_embed(embed):
+    if embed.author.name != STREAM_AUTHOR or len(embed.fields) < 2:
+        return None
+
+    def value(attr):
+        return None if attr is Embed.Empty else attr
+
+    return StreamRecord(nickname=value(embed.title),
+                        channel_url=value(embed.url),
+                        image=value(embed.thumbnail.url),
+                        competition=value(embed.description),
+                        team=embed.fields[0].value,
+                        viewers=embed.fields[1].value)
+
+
+#
+#   Fingerprint of everything that ends up in the rendered embed
+#
+def record_hash(record):
+    return hashlib.sha1(repr(tuple(str(field) for field in record)).encode('utf-8')).hexdigest()
+
+
+class StreamReconciler:
+    def __init__(self):
+        # nickname -> (Message, hash of the record it is showing)
+        self.messages = {}
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __contains__(self, nickname):
+        return nickname in self.messages
+
+    #
+    #   Warm start: index the stream messages we posted before a restart.
+    #
+    #   Reads the channel history once. Duplicate messages for the same stream
+    #   are deleted. Messages for streams that have since ended are left for
+    #   the next reconcile() to remove. Returns the intro message if found.
+    #
+    async def adopt(self, channel, bot_user, intro=None):
+        intro_message = None
+        async for message in channel.history(limit=None):
+            if message.author.id != bot_user.id:
+                continue
+
+            if intro != None and message.content.startswith(intro) and intro_message == None:
+                intro_message = message
+                continue
+
+            record = parse_embed(message.embeds[0]) if message.embeds else None
+            if record == None or record.nickname == None:
+                continue
+
+            if record.nickname in self.messages:
+                # History is newest first, keep the most recent copy
+                try:
+                    await message.delete()
+                except NotFound:
+                    pass
+                continue
+
+            self.messages[record.nickname] = (message, record_hash(record))
+
+        return intro_message
+
+    #
+    #   Make the channel match the given live streams.
+    #
+    #   A stream Discord won't take is skipped and retried next pass.
+    #   Returns (added, edited, removed) counts.
+    #
+    async def reconcile(self, channel, records):
+        live = {}
+        for record in records:
+            live[record.nickname] = record
+
+        added = edited = removed = 0
+        for nickname, record in live.items():
+            digest = record_hash(record)
+            existing = self.messages.get(nickname)
+
+            if existing == None:
+                try:
+                    message = await channel.send(embed=render_embed(record))
+                except HTTPException as e:
+                    print("Failed to post stream", nickname, e)
+                    continue
+                self.messages[nickname] = (message, digest)
+                added += 1
+                continue
+
+            message, shown = existing
+            if shown == digest:
+                continue
+
+            try:
+                await message.edit(embed=render_embed(record))
+                self.messages[nickname] = (message, digest)
+                edited += 1
+            except NotFound:
+                # Someone deleted it by hand. Forget it so it gets reposted next pass.
+                del self.messages[nickname]
+            except HTTPException as e:
+                print("Failed to update stream", nickname, e)
+
+        for nickname in [n for n in self.messages if n not in live]:
+            message, _ = self.messages.pop(nickname)
+            try:
+                await message.delete()
+            except NotFound:
+                pass
+            except HTTPException as e:
+                print("Failed to remove ended stream", nickname, e)
+            removed += 1
+
+        return added, edited, removed
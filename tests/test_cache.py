@@ -0,0 +1,132 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import cache
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        # Only the cache's clock; the event loop keeps the real one
+        patcher = mock.patch.object(cache, 'time', mock.Mock(monotonic=self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_missing_is_not_none(self):
+        entries = cache.TTLCache()
+        self.assertIs(entries.get('a'), cache.MISSING)
+        entries.set('a', None)
+        self.assertIs(entries.get('a'), None)
+        self.assertIn('a', entries)
+
+    def test_expiry(self):
+        entries = cache.TTLCache(ttl=10, negative_ttl=2)
+        entries.set('found', 'x')
+        entries.set('unlinked', None)
+        self.clock.now += 5
+        self.assertEqual(entries.get('found'), 'x')
+        self.assertIs(entries.get('unlinked'), cache.MISSING)
+        self.clock.now += 6
+        self.assertIs(entries.get('found'), cache.MISSING)
+        self.assertEqual(len(entries), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        entries = cache.TTLCache(max_size=2)
+        entries.set('a', 1)
+        entries.set('b', 2)
+        entries.get('a')
+        entries.set('c', 3)
+        self.assertIs(entries.get('b'), cache.MISSING)
+        self.assertEqual(entries.get('a'), 1)
+        self.assertEqual(entries.get('c'), 3)
+
+    def test_invalidate(self):
+        entries = cache.TTLCache()
+        entries.set('a', 1)
+        entries.invalidate('a')
+        entries.invalidate('never set')
+        self.assertIs(entries.get('a'), cache.MISSING)
+
+
+class SingleFlightCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        # Only the cache's clock; the event loop keeps the real one
+        patcher = mock.patch.object(cache, 'time', mock.Mock(monotonic=self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = 0
+        self.value = 'v1'
+
+    async def fetch(self, key):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+    def test_concurrent_misses_share_one_fetch(self):
+        lookups = cache.SingleFlightCache(self.fetch, ttl=15, stale_ttl=120)
+
+        async def scenario():
+            return await asyncio.gather(*[lookups.get('hub') for _ in range(5)])
+
+        self.assertEqual(run(scenario()), ['v1'] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        lookups = cache.SingleFlightCache(self.fetch, ttl=15, stale_ttl=120)
+
+        async def scenario():
+            await lookups.get('hub')
+            self.value = 'v2'
+            self.clock.now += 20
+            stale = await lookups.get('hub')
+            await asyncio.sleep(0.01)
+            return stale, await lookups.get('hub')
+
+        self.assertEqual(run(scenario()), ('v1', 'v2'))
+        self.assertEqual(self.calls, 2)
+
+    def test_failed_fetch_keeps_the_old_value(self):
+        lookups = cache.SingleFlightCache(self.fetch, ttl=15, stale_ttl=120)
+
+        async def scenario():
+            await lookups.get('hub')
+            self.value = RuntimeError("FACEIT is down")
+            self.clock.now += 200
+            return await lookups.get('hub')
+
+        self.assertEqual(run(scenario()), 'v1')
+
+    def test_none_is_not_cached(self):
+        self.value = None
+        lookups = cache.SingleFlightCache(self.fetch)
+
+        async def scenario():
+            await lookups.get('hub')
+            await lookups.get('hub')
+
+        run(scenario())
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
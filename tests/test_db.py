@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import pymysql
+
+import db
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.alive = True
+        self.pings = 0
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+        if not self.alive:
+            raise pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        # Only the pool's clock; the event loop keeps the real one
+        patcher = mock.patch.object(db, 'time', mock.Mock(monotonic=self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.opened = []
+        self.pool = db.ConnectionPool(self.connect, max_size=2, max_idle=300, ping_after=30)
+        self.addCleanup(self.pool.close)
+
+    def connect(self):
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+    def test_connections_are_reused(self):
+        async def scenario():
+            return [await self.pool.run(lambda conn: conn.number) for _ in range(3)]
+
+        self.assertEqual(run(scenario()), [0, 0, 0])
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual((self.pool.size, self.pool.idle), (1, 1))
+
+    def test_prune_closes_connections_idle_too_long(self):
+        run(self.pool.run(lambda conn: None))
+        self.clock.now += 100
+        self.pool.prune()
+        self.assertEqual((self.pool.size, self.pool.idle), (1, 1))
+
+        self.clock.now += 301
+        self.pool.prune()
+        self.assertEqual((self.pool.size, self.pool.idle), (0, 0))
+        self.assertTrue(self.opened[0].closed)
+
+    def test_failed_ping_drops_the_connection(self):
+        run(self.pool.run(lambda conn: None))
+        self.opened[0].alive = False
+        self.clock.now += 60
+
+        self.assertEqual(run(self.pool.run(lambda conn: conn.number)), 1)
+        self.assertEqual(self.opened[0].pings, 1)
+        self.assertTrue(self.opened[0].closed)
+        self.assertEqual(self.pool.size, 1)
+
+    def test_recently_used_connection_isnt_pinged(self):
+        run(self.pool.run(lambda conn: None))
+        self.clock.now += 10
+        run(self.pool.run(lambda conn: None))
+        self.assertEqual(self.opened[0].pings, 0)
+
+    def test_operational_error_discards_the_connection(self):
+        def lost(conn):
+            raise pymysql.err.OperationalError(2013, "Lost connection to MySQL server during query")
+
+        with self.assertRaises(pymysql.err.OperationalError):
+            run(self.pool.run(lost))
+        self.assertTrue(self.opened[0].closed)
+        self.assertEqual((self.pool.size, self.pool.idle), (0, 0))
+        self.assertEqual(run(self.pool.run(lambda conn: conn.number)), 1)
+
+    def test_query_error_keeps_the_connection(self):
+        def bad_sql(conn):
+            raise pymysql.err.ProgrammingError(1064, "You have an error in your SQL syntax")
+
+        with self.assertRaises(pymysql.err.ProgrammingError):
+            run(self.pool.run(bad_sql))
+        self.assertFalse(self.opened[0].closed)
+        self.assertEqual((self.pool.size, self.pool.idle), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import unittest
+
+import events
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def ready(match_id='m1'):
+    return {'event': events.MATCH_READY, 'match_id': match_id, 'hub': "NACCS Collegiate Queue",
+            'teams': [{'team_name': "a", 'players': ["p1"]}, {'team_name': "b", 'players': ["p2"]}]}
+
+
+class ParseEventTest(unittest.TestCase):
+    def test_valid_events(self):
+        self.assertEqual(events.parse_event(json.dumps(ready())), ready())
+        finished = {'event': events.MATCH_FINISHED, 'match_id': 'm1', 'hub': "NACCS Collegiate Queue"}
+        self.assertEqual(events.parse_event(json.dumps(finished)), finished)
+
+    def test_rejects_bad_bodies(self):
+        bad = [
+            "not json",
+            json.dumps(["a list"]),
+            json.dumps({'event': 'match_object_created', 'match_id': 'm1', 'hub': 'h'}),
+            json.dumps({'event': events.MATCH_FINISHED, 'hub': 'h'}),
+            json.dumps({'event': events.MATCH_FINISHED, 'match_id': 'm1'}),
+            json.dumps(dict(ready(), teams=None)),
+            json.dumps(dict(ready(), teams=[{'team_name': "a"}])),
+        ]
+        for body in bad:
+            with self.subTest(body=body):
+                with self.assertRaises(events.EventError):
+                    events.parse_event(body)
+
+
+class DispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.handled = []
+        self.failures = 0
+
+    async def handle(self, context, parsed):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Discord is down")
+        self.handled.append((context, parsed['match_id']))
+
+    def dispatcher(self):
+        return events.EventDispatcher({events.MATCH_READY: self.handle}, workers=2)
+
+    def test_duplicates_are_dropped(self):
+        dispatcher = self.dispatcher()
+
+        async def scenario():
+            dispatcher.start()
+            first = await dispatcher.submit('discord', ready())
+            second = await dispatcher.submit('webhook', ready())
+            await dispatcher.join()
+            await dispatcher.stop()
+            return first, second
+
+        self.assertEqual(run(scenario()), (True, False))
+        self.assertEqual(self.handled, [('discord', 'm1')])
+
+    def test_failed_event_can_be_redelivered(self):
+        dispatcher = self.dispatcher()
+        self.failures = 1
+
+        async def scenario():
+            dispatcher.start()
+            await dispatcher.submit(None, ready())
+            await dispatcher.join()
+            self.assertFalse(dispatcher.seen(ready()))
+            retried = await dispatcher.submit(None, ready())
+            await dispatcher.join()
+            await dispatcher.stop()
+            return retried
+
+        self.assertTrue(run(scenario()))
+        self.assertEqual(self.handled, [(None, 'm1')])
+
+    def test_nothing_is_handled_before_start(self):
+        dispatcher = self.dispatcher()
+
+        async def scenario():
+            self.assertTrue(await dispatcher.submit('early', ready()))
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.handled, [])
+            self.assertEqual(dispatcher.depth, 1)
+
+            dispatcher.start()
+            await dispatcher.join()
+            await dispatcher.stop()
+
+        run(scenario())
+        self.assertEqual(self.handled, [('early', 'm1')])
+
+    def test_events_for_a_match_stay_in_order(self):
+        order = []
+
+        async def record(context, parsed):
+            await asyncio.sleep(0.01 if parsed['event'] == events.MATCH_READY else 0)
+            order.append(parsed['event'])
+
+        dispatcher = events.EventDispatcher({events.MATCH_READY: record, events.MATCH_FINISHED: record}, workers=4)
+
+        async def scenario():
+            dispatcher.start()
+            await dispatcher.submit(None, ready())
+            await dispatcher.submit(None, {'event': events.MATCH_FINISHED, 'match_id': 'm1', 'hub': 'h'})
+            await dispatcher.join()
+            await dispatcher.stop()
+
+        run(scenario())
+        self.assertEqual(order, [events.MATCH_READY, events.MATCH_FINISHED])
+
+
+if __name__ == '__main__':
+    unittest.main()
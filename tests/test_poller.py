@@ -0,0 +1,59 @@
+import unittest
+
+import poller
+from streams import StreamRecord
+
+
+def record(nickname, viewers=10):
+    return StreamRecord(nickname=nickname, channel_url="https://twitch.tv/" + nickname, image=None,
+                        competition="NACCS", team="Team " + nickname, viewers=viewers)
+
+
+class StreamsDiffTest(unittest.TestCase):
+    def setUp(self):
+        self.poller = poller.Poller('unused.sock', [], None, None)
+
+    def test_first_fetch_is_full(self):
+        message = self.poller.streams_diff([record("a"), record("b")])
+        self.assertTrue(message['full'])
+        self.assertEqual(message['set'], [list(record("a")), list(record("b"))])
+        self.assertEqual(message['removed'], [])
+
+    def test_only_changes_are_sent(self):
+        self.poller.streams_diff([record("a"), record("b"), record("c")])
+        message = self.poller.streams_diff([record("a"), record("b", viewers=99), record("d")])
+        self.assertFalse(message['full'])
+        self.assertEqual(message['set'], [list(record("b", viewers=99)), list(record("d"))])
+        self.assertEqual(message['removed'], ["c"])
+
+    def test_nothing_changed(self):
+        self.poller.streams_diff([record("a")])
+        message = self.poller.streams_diff([record("a")])
+        self.assertEqual((message['full'], message['set'], message['removed']), (False, [], []))
+
+    def test_snapshot_resends_everything(self):
+        self.assertEqual(self.poller.snapshot(), [])
+        self.poller.streams_diff([record("a")])
+        self.poller.hubs[1] = {'in_queue': 3}
+        self.assertEqual(self.poller.snapshot(), [
+            {'type': 'streams', 'full': True, 'set': [list(record("a"))], 'removed': []},
+            {'type': 'hub', 'channel_id': 1, 'in_queue': 3},
+        ])
+
+
+class ApplyStreamsTest(unittest.TestCase):
+    def test_round_trip(self):
+        source = poller.Poller('unused.sock', [], None, None)
+        live = {}
+        for fetched in ([record("a"), record("b")], [record("b", viewers=5), record("c")], []):
+            poller.apply_streams(live, source.streams_diff(fetched))
+            self.assertEqual(live, {r.nickname: r for r in fetched})
+
+    def test_full_message_replaces_everything(self):
+        live = {"old": record("old")}
+        poller.apply_streams(live, {'type': 'streams', 'full': True, 'set': [list(record("a"))], 'removed': []})
+        self.assertEqual(live, {"a": record("a")})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import time
+import unittest
+
+import ratelimit
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = ratelimit.TokenBucket('test', rate=50, burst=2)
+
+        async def take(count):
+            started = time.monotonic()
+            for _ in range(count):
+                await bucket.acquire(ratelimit.MATCH)
+            return time.monotonic() - started
+
+        self.assertLess(run(take(2)), 0.01)
+        self.assertGreaterEqual(run(take(1)), 0.015)
+
+    def test_lower_priorities_leave_a_reserve(self):
+        # Slow enough that nothing refills during the test
+        bucket = ratelimit.TokenBucket('test', rate=0.001, burst=5)
+
+        async def scenario():
+            for _ in range(3):
+                await asyncio.wait_for(bucket.acquire(ratelimit.BACKGROUND), 0.1)
+            # Two left: not enough for background, enough for a command
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(bucket.acquire(ratelimit.BACKGROUND), 0.05)
+            await asyncio.wait_for(bucket.acquire(ratelimit.COMMAND), 0.1)
+            await asyncio.wait_for(bucket.acquire(ratelimit.MATCH), 0.1)
+
+        run(scenario())
+
+    def test_waiters_are_served_by_priority(self):
+        bucket = ratelimit.TokenBucket('test', rate=50, burst=1)
+        order = []
+
+        async def take(priority):
+            await bucket.acquire(priority)
+            order.append(priority)
+
+        async def scenario():
+            await bucket.acquire(ratelimit.MATCH)
+            background = asyncio.ensure_future(take(ratelimit.BACKGROUND))
+            await asyncio.sleep(0)
+            await take(ratelimit.MATCH)
+            await background
+
+        run(scenario())
+        self.assertEqual(order, [ratelimit.MATCH, ratelimit.BACKGROUND])
+
+    def test_exhausted_headers_pause_the_bucket(self):
+        bucket = ratelimit.TokenBucket('test', rate=50, burst=10)
+        bucket.update({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '5'})
+        self.assertGreater(bucket._delay(ratelimit.MATCH), 4)
+
+    def test_remaining_header_only_lowers_tokens(self):
+        bucket = ratelimit.TokenBucket('test', rate=0.001, burst=10)
+        bucket.update({'X-RateLimit-Remaining': '3'})
+        self.assertAlmostEqual(bucket.tokens, 3, places=2)
+        bucket.update({'X-RateLimit-Remaining': '50'})
+        self.assertAlmostEqual(bucket.tokens, 3, places=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import schools
+
+ROWS = [
+    {'id': 1, 'name': "University of Texas", 'abbreviation': "UT"},
+    {'id': 2, 'name': "Texas A&M University", 'abbreviation': "TAMU"},
+    {'id': 3, 'name': "Miami University", 'abbreviation': "MU"},
+    {'id': 4, 'name': "University of Miami", 'abbreviation': "UM"},
+    {'id': 5, 'name': "Ohio State", 'abbreviation': "OSU"},
+    {'id': 6, 'name': "St. John's University", 'abbreviation': "SJU"},
+    {'id': 7, 'name': "Georgia Institute of Technology", 'abbreviation': "GT"},
+]
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_abbreviations_and_filler_words(self):
+        self.assertEqual(schools.normalize("Univ. of Texas"), "texas university")
+        self.assertEqual(schools.normalize("The University of Texas"), "texas university")
+        self.assertEqual(schools.normalize("Georgia Inst. of Tech"), "georgia institute technology")
+
+    def test_ampersand_and_apostrophes(self):
+        self.assertEqual(schools.normalize("Texas A&M University"), schools.normalize("Texas A and M University"))
+        self.assertEqual(schools.normalize("St. John's"), schools.normalize("St Johns"))
+
+    def test_st_is_state_only_at_the_end(self):
+        self.assertEqual(schools.normalize("Ohio St."), "ohio state")
+        self.assertEqual(schools.normalize("St. John's University"), "johns st university")
+
+
+class LookupTest(unittest.TestCase):
+    def setUp(self):
+        self.index = schools.SchoolIndex(ROWS)
+
+    def test_exact_name(self):
+        self.assertEqual(self.index.lookup("University of Texas"), "UT")
+
+    def test_name_variants(self):
+        self.assertEqual(self.index.lookup("Univ. of Texas"), "UT")
+        self.assertEqual(self.index.lookup("Ohio St"), "OSU")
+        self.assertEqual(self.index.lookup("St Johns Univ"), "SJU")
+
+    def test_typo(self):
+        self.assertEqual(self.index.lookup("University of Texs"), "UT")
+
+    def test_fuzzy_match_never_adds_a_word(self):
+        self.assertEqual(self.index.lookup("Texas A and M Univ"), "TAMU")
+        self.assertEqual(self.index.lookup("University of Texas A"), None)
+
+    def test_schools_that_normalize_alike(self):
+        # The exact names still work, but a variant can't pick between them
+        self.assertEqual(self.index.lookup("Miami University"), "MU")
+        self.assertEqual(self.index.lookup("University of Miami"), "UM")
+        self.assertEqual(self.index.lookup("Miami Univ"), None)
+
+    def test_unknown_or_empty(self):
+        self.assertEqual(self.index.lookup("Rice University"), None)
+        self.assertEqual(self.index.lookup(""), None)
+        self.assertEqual(self.index.lookup(None), None)
+
+    def test_add_tracks_last_id(self):
+        self.index.add([{'id': 12, 'name': "Rice University", 'abbreviation': "RICE"}])
+        self.assertEqual(self.index.last_id, 12)
+        self.assertEqual(self.index.lookup("Rice Univ"), "RICE")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+import streams
+
+
+def entry(**stream):
+    fields = {'channelUrl': "https://twitch.tv/player", 'channelLogo': "https://cdn.example/logo.png", 'viewers': 12}
+    fields.update(stream)
+    return {'userNickname': "player", 'competitionName': "NACCS", 'factionNickname': "Team A", 'stream': fields}
+
+
+class ParseStreamTest(unittest.TestCase):
+    def test_complete_entry(self):
+        self.assertEqual(streams.parse_stream(entry()),
+                        streams.StreamRecord("player", "https://twitch.tv/player", "https://cdn.example/logo.png",
+                                            "NACCS", "Team A", 12))
+
+    def test_missing_fields_get_a_placeholder(self):
+        raw = entry(viewers=None, channelLogo=None)
+        del raw['competitionName']
+        raw['factionNickname'] = None
+        record = streams.parse_stream(raw)
+        self.assertEqual((record.image, record.competition, record.team, record.viewers),
+                        (None, streams.PLACEHOLDER, streams.PLACEHOLDER, streams.PLACEHOLDER))
+
+    def test_incomplete_entry(self):
+        self.assertEqual(streams.parse_stream({'userNickname': "player"}), None)
+        self.assertEqual(streams.parse_stream(None), None)
+
+
+class RenderEmbedTest(unittest.TestCase):
+    def test_logo_is_the_thumbnail(self):
+        embed = streams.render_embed(streams.parse_stream(entry()))
+        self.assertEqual(embed.to_dict()['thumbnail'], {'url': "https://cdn.example/logo.png"})
+
+    def test_no_logo_means_no_thumbnail(self):
+        record = streams.parse_stream(entry(channelLogo=None))
+        embed = streams.render_embed(record)
+        self.assertNotIn('thumbnail', embed.to_dict())
+        self.assertEqual(streams.parse_embed(embed), record._replace(viewers="12"))
+
+    def test_round_trip_keeps_the_hash(self):
+        record = streams.parse_stream(entry())
+        self.assertEqual(streams.record_hash(streams.parse_embed(streams.render_embed(record))),
+                        streams.record_hash(record))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import datetime
+import unittest
+
+import pytz
+
+import window
+
+EASTERN = pytz.timezone('America/New_York')
+
+
+def eastern(*args):
+    return EASTERN.localize(datetime.datetime(*args)).astimezone(pytz.utc)
+
+
+def utc(*args):
+    return pytz.utc.localize(datetime.datetime(*args))
+
+
+class NextTransitionTest(unittest.TestCase):
+    def setUp(self):
+        self.window = window.QueueWindow('America/New_York')
+
+    def test_opens_later_today(self):
+        # Monday before the 17:00 open
+        self.assertEqual(self.window.next_transition(eastern(2020, 1, 6, 12, 0)), (utc(2020, 1, 6, 22, 0), True))
+
+    def test_closes_tonight(self):
+        self.assertEqual(self.window.next_transition(eastern(2020, 1, 6, 18, 0)), (utc(2020, 1, 7, 3, 0), False))
+
+    def test_weekend_closes_later(self):
+        # Friday's window runs until 23:59
+        self.assertEqual(self.window.next_transition(eastern(2020, 1, 10, 22, 30)), (eastern(2020, 1, 10, 23, 59), False))
+
+    def test_daylight_saving(self):
+        # Clocks went forward that morning, so 17:00 is 21:00 UTC, not 22:00
+        self.assertEqual(self.window.next_transition(eastern(2020, 3, 8, 12, 0)), (utc(2020, 3, 8, 21, 0), True))
+
+    def test_window_past_midnight(self):
+        late = window.QueueWindow('America/New_York', days={'monday': ["22:00", "02:00"]})
+        self.assertEqual(late.next_transition(eastern(2020, 1, 6, 23, 0)), (eastern(2020, 1, 7, 2, 0), False))
+        self.assertTrue(late.is_open_at(eastern(2020, 1, 7, 1, 0)))
+
+    def test_skips_closed_days(self):
+        weekly = window.QueueWindow('America/New_York', days={'wednesday': ["17:00", "22:00"]})
+        self.assertEqual(weekly.next_transition(eastern(2020, 1, 9, 12, 0)), (eastern(2020, 1, 15, 17, 0), True))
+
+    def test_no_windows(self):
+        self.assertEqual(window.QueueWindow('America/New_York', days={}).next_transition(eastern(2020, 1, 6, 12, 0)), None)
+
+
+class LastTransitionTest(unittest.TestCase):
+    def setUp(self):
+        self.window = window.QueueWindow('America/New_York')
+
+    def test_opened_earlier_today(self):
+        self.assertEqual(self.window.last_transition(eastern(2020, 1, 6, 18, 0)), (eastern(2020, 1, 6, 17, 0), True))
+
+    def test_closed_last_night(self):
+        self.assertEqual(self.window.last_transition(eastern(2020, 1, 7, 10, 0)), (eastern(2020, 1, 6, 22, 0), False))
+
+    def test_exactly_at_a_transition(self):
+        opens = eastern(2020, 1, 6, 17, 0)
+        self.assertEqual(self.window.last_transition(opens), (opens, True))
+        self.assertEqual(self.window.next_transition(opens), (eastern(2020, 1, 6, 22, 0), False))
+
+
+class ParseTest(unittest.TestCase):
+    def test_days(self):
+        self.assertEqual(window.parse_days("Mon"), ["monday"])
+        self.assertEqual(window.parse_days("weekends"), ["saturday", "sunday"])
+        with self.assertRaises(window.WindowError):
+            window.parse_days("mo")
+
+    def test_bad_time_and_timezone(self):
+        with self.assertRaises(window.WindowError):
+            window.parse_time("5pm")
+        with self.assertRaises(window.WindowError):
+            window.parse_timezone("Eastern")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import json
+import math
+import time
+from collections import OrderedDict, deque
+
+"""
+-------------------------------------------------------------------------------
+    Match lifecycle tracing
+
+    Records when each step of setting up and tearing down a match happened,
+    keyed by FACEIT match ID. Finished timings go into a fixed size ring
+    buffer (and optionally a JSON lines file) for the .matchstats command.
+-------------------------------------------------------------------------------
+"""
+
+# Span names
+READY_RECEIVED      = "ready_received"
+CHANNELS_CREATED    = "channels_created"
+PLAYERS_MOVED       = "players_moved"
+TEARDOWN_RECEIVED   = "teardown_received"
+TEARDOWN_DONE       = "teardown_done"
+
+
+#
+#   Nearest-rank percentile of an already sorted list
+#
+def percentile(values, p):
+    if not values:
+        return None
+    rank = max(1, int(math.ceil(p * len(values) / 100.0)))
+    return values[rank - 1]
+
+
+class MatchTracer:
+    def __init__(self, capacity=500, spill_path=None, max_age=6 * 3600):
+        # max_age: seconds before an unfinished match is given up on, e.g. a
+        # ready whose setup failed or a finish for a match we never set up
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.max_age = max_age
+        # match_id -> {span: monotonic timestamp}, for matches still in progress
+        self._active = OrderedDict()
+        # Completed records, newest last
+        self.setups = deque(maxlen=capacity)
+        self.teardowns = deque(maxlen=capacity)
+
+    #
+    #   Record that `span` happened now. By default the first mark wins so a
+    #   duplicate webhook doesn't reset the clock; pass last=True to keep
+    #   moving it forward (e.g. once per channel created).
+    #
+    def mark(self, match_id, span, last=False):
+        spans = self._active.get(match_id)
+        if spans == None:
+            self._evict()
+            spans = self._active[match_id] = {}
+            while len(self._active) > self.capacity:
+                self._active.popitem(last=False)
+
+        if last or span not in spans:
+            spans[span] = time.monotonic()
+
+    #
+    #   Drop matches that started too long ago to ever finish. Oldest are
+    #   first, since entries are only ever added at the end.
+    #
+    def _evict(self):
+        now = time.monotonic()
+        while self._active:
+            spans = next(iter(self._active.values()))
+            if spans and now - min(spans.values()) < self.max_age:
+                return
+            self._active.popitem(last=False)
+
+    def setup_done(self, match_id, hub=None):
+        self.mark(match_id, PLAYERS_MOVED)
+        spans = self._active.get(match_id, {})
+        start = spans.get(READY_RECEIVED)
+        if start == None:
+            return
+
+        record = {
+            'match_id': match_id,
+            'hub': hub,
+            'at': time.time(),
+            'channels': spans[CHANNELS_CREATED] - start if CHANNELS_CREATED in spans else None,
+            'setup': spans[PLAYERS_MOVED] - start,
+        }
+        self.setups.append(record)
+        self._spill('setup', record)
+
+    def teardown_done(self, match_id, hub=None):
+        self.mark(match_id, TEARDOWN_DONE)
+        spans = self._active.pop(match_id, {})
+        start = spans.get(TEARDOWN_RECEIVED)
+        if start == None:
+            return
+
+        record = {
+            'match_id': match_id,
+            'hub': hub,
+            'at': time.time(),
+            'teardown': spans[TEARDOWN_DONE] - start,
+        }
+        self.teardowns.append(record)
+        self._spill('teardown', record)
+
+    def _spill(self, kind, record):
+        if self.spill_path == None:
+            return
+        try:
+            with open(self.spill_path, 'a') as f:
+                f.write(json.dumps(dict(record, kind=kind)) + '\n')
+        except OSError as e:
+            print("Could not write match trace", e)
+
+    #
+    #   p50/p95/p99 of a field over the last `count` records.
+    #   Returns (samples, {p: seconds}).
+    #
+    def summary(self, records, field, count):
+        values = sorted(r[field] for r in list(records)[-count:] if r.get(field) != None)
+        return len(values), {p: percentile(values, p) for p in (50, 95, 99)}
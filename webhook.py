@@ -0,0 +1,88 @@
+import asyncio
+import hmac
+
+import sentry_sdk
+from aiohttp import web
+
+import events
+import metrics
+
+"""
+-------------------------------------------------------------------------------
+    Direct FACEIT webhook receiver
+
+    FACEIT posts match events straight to the bot instead of to a Discord
+    webhook, which saves a round trip through Discord and the gateway before
+    match handling can start. Requests must carry the shared secret in a
+    header, as a bearer token or as X-Webhook-Secret. It's never taken from
+    the URL, where it would end up in access logs.
+
+    Events are acknowledged as soon as they parse and handled in the
+    background, so FACEIT never waits on Discord. Events that also arrive
+    through the Discord webhook channel are dropped as duplicates by the
+    event dispatcher.
+-------------------------------------------------------------------------------
+"""
+
+WEBHOOK_PATH = '/faceit'
+
+# FACEIT payloads are a few KB; anything much bigger isn't from FACEIT
+MAX_BODY = 256 * 1024
+
+WEBHOOK_REQUESTS = metrics.registry.counter('naccs_webhook_requests_total', 'FACEIT webhook POSTs received directly',
+                                            labels=('outcome',))
+
+
+def _presented_secret(request):
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        return authorization[len('Bearer '):]
+    return request.headers.get('X-Webhook-Secret') or ''
+
+
+def _ingest_done(task):
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error != None:
+        print("Failed to ingest webhook event", repr(error))
+        sentry_sdk.capture_exception(error)
+
+
+#
+#   Serve the webhook endpoint. ingest is a coroutine function(context,
+#   parsed); context is always None for events received here.
+#
+#   Returns the aiohttp runner so the caller can clean it up.
+#
+async def serve(secret, ingest, host='127.0.0.1', port=8080, path=WEBHOOK_PATH):
+    if not secret:
+        raise ValueError("Refusing to serve the FACEIT webhook without a secret")
+
+    async def handle(request):
+        if not hmac.compare_digest(_presented_secret(request).encode('utf-8'), secret.encode('utf-8')):
+            WEBHOOK_REQUESTS.inc(outcome='unauthorized')
+            return web.Response(status=401)
+
+        try:
+            parsed = events.parse_event(await request.text())
+        except events.EventError as e:
+            # FACEIT retries anything that isn't a 2xx, so events we don't
+            # handle are still acknowledged
+            WEBHOOK_REQUESTS.inc(outcome='ignored')
+            print("Ignoring webhook POST:", e)
+            return web.Response(status=204)
+
+        WEBHOOK_REQUESTS.inc(outcome='accepted')
+        print(parsed)
+        task = asyncio.ensure_future(ingest(None, parsed))
+        task.add_done_callback(_ingest_done)
+        return web.Response(status=202)
+
+    app = web.Application(client_max_size=MAX_BODY)
+    app.router.add_post(path, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print("Serving FACEIT webhook on", host, port, path)
+    return runner
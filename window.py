@@ -0,0 +1,220 @@
+import asyncio
+import datetime
+
+import pytz
+
+"""
+-------------------------------------------------------------------------------
+    Power Pugs queue window
+
+    A weekly open/close schedule in a fixed timezone. The scheduler works out
+    the next open or close deadline and sleeps until then, rather than
+    polling. The schedule is saved in the state store so it comes back after
+    a restart.
+-------------------------------------------------------------------------------
+"""
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+DAY_GROUPS = {
+    'all': DAYS,
+    'weekdays': DAYS[:5],
+    'weekends': DAYS[5:],
+}
+
+# The schedule the bot shipped with: 17:00 every day, closing at 22:00 on
+# weeknights and 23:59 Friday through Sunday
+DEFAULT_DAYS = {day: ["17:00", "22:00"] for day in DAYS[:4]}
+DEFAULT_DAYS.update({day: ["17:00", "23:59"] for day in DAYS[4:]})
+
+SETTINGS_KEY = 'powerpugs_window'
+# UTC timestamp of the last transition applied, so a restart only catches up
+# on one it actually missed
+APPLIED_KEY = 'powerpugs_window_applied'
+
+# Longest single sleep, so clock changes and config edits are picked up
+MAX_SLEEP = 3600
+
+
+class WindowError(ValueError):
+    pass
+
+
+def parse_time(value):
+    try:
+        return datetime.datetime.strptime(value, "%H:%M").time()
+    except ValueError:
+        raise WindowError("Times must look like 17:00, got {!r}".format(value))
+
+
+def parse_days(value):
+    value = value.lower()
+    if value in DAY_GROUPS:
+        return DAY_GROUPS[value]
+    for day in DAYS:
+        if day.startswith(value) and len(value) >= 3:
+            return [day]
+    raise WindowError("Unknown day {!r}".format(value))
+
+
+def parse_timezone(value):
+    try:
+        return pytz.timezone(value)
+    except pytz.UnknownTimeZoneError:
+        raise WindowError("Unknown timezone {!r}, use a name like America/New_York".format(value))
+
+
+class QueueWindow:
+    def __init__(self, timezone, days=None, enabled=False):
+        # days: weekday name -> [open "HH:MM", close "HH:MM"], or missing if
+        #       the queue stays closed that day. A close at or before the open
+        #       time means the window runs past midnight.
+        self.timezone = parse_timezone(timezone)
+        self.days = dict(DEFAULT_DAYS if days == None else days)
+        self.enabled = enabled
+
+    @classmethod
+    def from_config(cls, config, default_timezone):
+        return cls(config.get('timezone', default_timezone), config.get('days'), config.get('enabled', False))
+
+    def to_config(self):
+        return {'timezone': self.timezone.zone, 'days': self.days, 'enabled': self.enabled}
+
+    def set_day(self, day, open_at, close_at):
+        parse_time(open_at)
+        parse_time(close_at)
+        self.days[day] = [open_at, close_at]
+
+    def clear_day(self, day):
+        self.days.pop(day, None)
+
+    #
+    #   (open, close) UTC datetimes for every window that starts within a week
+    #   either side of `now`
+    #
+    def _windows(self, now):
+        local_today = now.astimezone(self.timezone).date()
+        for offset in range(-7, 8):
+            date = local_today + datetime.timedelta(days=offset)
+            hours = self.days.get(DAYS[date.weekday()])
+            if hours == None:
+                continue
+
+            open_time, close_time = parse_time(hours[0]), parse_time(hours[1])
+            close_date = date if close_time > open_time else date + datetime.timedelta(days=1)
+            opens = self.timezone.localize(datetime.datetime.combine(date, open_time))
+            closes = self.timezone.localize(datetime.datetime.combine(close_date, close_time))
+            yield opens.astimezone(pytz.utc), closes.astimezone(pytz.utc)
+
+    def is_open_at(self, now):
+        return any(opens <= now < closes for opens, closes in self._windows(now))
+
+    #
+    #   Returns (when, should_open) for the next transition after `now`, or
+    #   None if no day has a window
+    #
+    def next_transition(self, now):
+        events = []
+        for opens, closes in self._windows(now):
+            if opens > now:
+                events.append((opens, True))
+            if closes > now:
+                events.append((closes, False))
+        return min(events) if events else None
+
+    #
+    #   Returns (when, should_open) for the latest transition at or before
+    #   `now`, or None if no day has a window
+    #
+    def last_transition(self, now):
+        events = []
+        for opens, closes in self._windows(now):
+            if opens <= now:
+                events.append((opens, True))
+            if closes <= now:
+                events.append((closes, False))
+        return max(events) if events else None
+
+    def describe(self):
+        lines = ["Timezone: {}".format(self.timezone.zone)]
+        for day in DAYS:
+            hours = self.days.get(day)
+            lines.append("{:<10} {}".format(day.capitalize(), "{} - {}".format(*hours) if hours else "closed"))
+        return "\n".join(lines)
+
+
+class WindowScheduler:
+    def __init__(self, store, set_open, default_timezone, retries=3, retry_delay=30):
+        # set_open: coroutine function(should_open) -> True once FACEIT
+        #           confirms the queue is in that state
+        self.store = store
+        self.set_open = set_open
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.window = QueueWindow.from_config(store.get_setting(SETTINGS_KEY, {}), default_timezone)
+        self._task = None
+
+    @property
+    def enabled(self):
+        return self.window.enabled
+
+    def save(self):
+        self.store.set_setting(SETTINGS_KEY, self.window.to_config())
+
+    #
+    #   (Re)start the timer after the window or its enabled state changes
+    #
+    def restart(self):
+        self.save()
+        if self._task != None:
+            self._task.cancel()
+            self._task = None
+        if self.window.enabled:
+            self._task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self._task != None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self):
+        # Catch up first, but only on a transition missed while offline. A
+        # plain restart mustn't undo a manual open/close by staff.
+        now = datetime.datetime.now(pytz.utc)
+        missed = self.window.last_transition(now)
+        applied_at = self.store.get_setting(APPLIED_KEY)
+        if missed != None and (applied_at == None or applied_at < missed[0].timestamp()):
+            await self.apply(missed[1], missed[0])
+
+        while True:
+            now = datetime.datetime.now(pytz.utc)
+            transition = self.window.next_transition(now)
+            if transition == None:
+                return
+
+            when, should_open = transition
+            delay = (when - now).total_seconds()
+            if delay > MAX_SLEEP:
+                await asyncio.sleep(MAX_SLEEP)
+                continue
+
+            await asyncio.sleep(max(0, delay))
+            await self.apply(should_open, when)
+
+    #
+    #   Open or close the queue for the transition at `when`
+    #
+    async def apply(self, should_open, when):
+        for attempt in range(self.retries):
+            try:
+                if await self.set_open(should_open):
+                    print("Power Pugs", "opened" if should_open else "closed")
+                    self.store.set_setting(APPLIED_KEY, when.timestamp())
+                    return True
+            except Exception as e:
+                print("Failed to change Power Pugs open/close", repr(e))
+            if attempt + 1 < self.retries:
+                await asyncio.sleep(self.retry_delay * (attempt + 1))
+
+        print("Gave up", "opening" if should_open else "closing", "Power Pugs")
+        return False